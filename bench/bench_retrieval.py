@@ -0,0 +1,133 @@
+"""
+Retrieval and ingest benchmark against a synthetic corpus and an in-memory
+Supabase stand-in (no network, no database).
+
+run with
+python bench/bench_retrieval.py --rows 100000 --queries 500 --concurrency 16
+python bench/bench_retrieval.py --rows 1000000 --ingest 0 --output bench_results.jsonl
+RETRIEVAL_HYBRID=1 python bench/bench_retrieval.py --rows 10000
+
+Measures the index load, search_documents with precomputed query vectors,
+qeury_database end to end (embedding included) sequentially and under
+concurrency, and add_document / add_documents ingest rates.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from common import Timer, bench_env, latency_stats, write_results
+
+
+async def timed_calls(calls, concurrency):
+    """Runs the coroutine factories with at most concurrency in flight, returns (durations, elapsed)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+
+    async def run(call):
+        async with semaphore:
+            start = time.perf_counter()
+            await call()
+            durations.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(call) for call in calls))
+    return durations, time.perf_counter() - start
+
+
+def lesson(corpus, i):
+    seed = corpus.seeds[i % len(corpus.seeds)]
+    year, room, subject = corpus.scope(i)
+    return {
+        "content": f"{seed['content']} (บันทึกใหม่ {i})",
+        "time_summit": "2025-09-01T09:00:00Z",
+        "time_of_record": "09:30:00",
+        "teacher_name": seed["teacher_name"],
+        "teacher_subject": subject,
+        "student_year": year,
+        "student_room": room,
+    }
+
+
+async def run(args, func, corpus):
+    results = {}
+    rng = random.Random(args.seed)
+    queries = corpus.queries(args.queries, seed=args.seed)
+    scopes = corpus.scopes()
+    # every query is asked in one class scope, like the endpoints do
+    asked = [(query,) + rng.choice(scopes) for query in queries]
+
+    if func.RETRIEVAL_MODE == "local":
+        with Timer() as t:
+            rows = await asyncio.to_thread(func.load_index)
+        results["index_load"] = {"rows": rows, "seconds": round(t.seconds, 3),
+                                 "rows_per_second": round(rows / t.seconds, 1) if t.seconds else None}
+
+    with Timer() as t:
+        vectors = func.embedder.encode_batch(queries)
+    results["embed_batch"] = {"texts": len(queries), "seconds": round(t.seconds, 3)}
+
+    calls = [lambda v=v, a=a: func.search_documents(v, args.k, a[2], a[1], a[3], a[0])
+             for v, a in zip(vectors, asked)]
+    durations, elapsed = await timed_calls(calls, 1)
+    results["search_documents"] = latency_stats(durations, elapsed)
+
+    calls = [lambda a=a: func.qeury_database(a[0], args.k, a[2], a[1], a[3]) for a in asked]
+    durations, elapsed = await timed_calls(calls, 1)
+    results["qeury_database_sequential"] = latency_stats(durations, elapsed)
+    durations, elapsed = await timed_calls(calls, args.concurrency)
+    results["qeury_database_concurrent"] = dict(latency_stats(durations, elapsed), concurrency=args.concurrency)
+
+    if args.ingest:
+        calls = [lambda i=i: func.add_document(lesson(corpus, i)) for i in range(args.ingest)]
+        durations, elapsed = await timed_calls(calls, 1)
+        results["add_document"] = latency_stats(durations, elapsed)
+
+    if args.bulk:
+        docs = [lesson(corpus, args.ingest + i) for i in range(args.bulk)]
+        with Timer() as t:
+            outcome = await func.add_documents(docs)
+        results["add_documents"] = {"documents": args.bulk, "inserted": outcome["inserted"],
+                                    "seconds": round(t.seconds, 3),
+                                    "per_second": round(args.bulk / t.seconds, 2) if t.seconds else None}
+
+    results["vector_index"] = {"rows": len(func.index), "partitions": func.index.partition_count,
+                               "rows_scanned": func.index.rows_scanned}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000, help="synthetic documents rows (1k to 1M)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--ingest", type=int, default=100, help="documents added one by one with add_document")
+    parser.add_argument("--bulk", type=int, default=500, help="documents added with one add_documents call")
+    parser.add_argument("--rooms-per-year", type=int, default=10)
+    parser.add_argument("--db-latency", type=float, default=0.0, help="seconds added to each Supabase round trip")
+    parser.add_argument("--storage-format", default=os.getenv("EMBEDDING_STORAGE_FORMAT", "float32"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="append the results as a JSON line to this file")
+    args = parser.parse_args()
+
+    bench_env()
+    os.environ["EMBEDDING_STORAGE_FORMAT"] = args.storage_format
+    import fake_supabase
+    import func
+    from corpus import Corpus
+
+    corpus = Corpus(args.rows, rooms_per_year=args.rooms_per_year, storage_format=args.storage_format, seed=args.seed)
+    fake_supabase.install(func, {"documents": corpus}, latency=args.db_latency)
+    results = asyncio.run(run(args, func, corpus))
+
+    config = dict(vars(args), retrieval_mode=func.RETRIEVAL_MODE, hybrid=func.RETRIEVAL_HYBRID,
+                  passage_chunking=func.PASSAGE_CHUNKING, embedding_model=func.embedder.model_name,
+                  ann_min_rows=func.index.ann_min_rows)
+    config.pop("output")
+    write_results("retrieval", config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Shared helpers for the benchmark scripts: environment for importing func
+against the in-memory stand-ins, latency statistics and JSON results.
+"""
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+
+def bench_env(mock_llm_url=None):
+    """
+    Defaults for importing func without a real Supabase project: the client
+    is created but never called once fake_supabase.install() replaced it.
+    Values already in the environment (or .env) win.
+    """
+    os.environ.setdefault("PUBLIC_SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("PUBLIC_SUPABASE_ANON_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.bench")
+    os.environ.setdefault("INDEX_SYNC_INTERVAL", "0")
+    os.environ.setdefault("RESPONSE_CACHE", "off")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if mock_llm_url:
+        os.environ["GEMINI_BASE_URL"] = f"{mock_llm_url}/v1beta"
+        os.environ["OLLAMA_HOST"] = mock_llm_url
+        os.environ["APIKEYS"] = os.environ.get("APIKEYS") or "mock"
+
+
+def start_mock_llm(port, latency, token_delay, error_rate=0.0):
+    """Runs bench/mock_llm.py in a daemon thread, returns its base URL."""
+    from http.server import ThreadingHTTPServer
+    from types import SimpleNamespace
+
+    import mock_llm
+
+    mock_llm.Handler.options = SimpleNamespace(latency=latency, token_delay=token_delay,
+                                               error_rate=error_rate, quiet=True)
+    server = ThreadingHTTPServer(("127.0.0.1", port), mock_llm.Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * p / 100
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def latency_stats(seconds, elapsed=None):
+    """Milliseconds p50/p95/p99/mean/max of a list of durations, plus throughput."""
+    values = sorted(seconds)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None  # noqa: E731
+    stats = {
+        "count": len(values),
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "max_ms": ms(values[-1]) if values else None,
+    }
+    if elapsed:
+        stats["per_second"] = round(len(values) / elapsed, 2)
+    return stats
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+
+
+def write_results(name, config, results, output=None):
+    """Prints the run as one JSON document and appends it to output (JSON lines) if given."""
+    document = {
+        "benchmark": name,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": config,
+        "results": results,
+    }
+    print(json.dumps(document, ensure_ascii=False, indent=2))
+    if output:
+        with open(output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(document, ensure_ascii=False) + "\n")
+    return document
@@ -0,0 +1,112 @@
+"""
+Synthetic documents corpus seeded from database/documents.sql.
+
+Rows are generated on demand from their id (seed lesson + noise on its
+embedding), so a 1M row corpus doesn't have to sit in memory.
+"""
+import os
+import re
+import sys
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from embedding_codec import encode_embedding  # noqa: E402
+
+SEED_SQL = os.path.join(ROOT, "database", "documents.sql")
+SUBJECTS = ["bio", "phy", "chem", "math", "eng", "geo", "his", "eco", "soc", "comsci"]
+_ROW = re.compile(
+    r"^\((\d+), '((?:[^'\\]|\\.|'')*)', '(\[[^\]]*\])', '([^']*)', '([^']*)', "
+    r"'((?:[^'\\]|\\.|'')*)', '([^']*)', (\d+), (\d+)\)[,;]$")
+
+
+def load_seed(path=SEED_SQL):
+    """Parses the rows of the documents INSERT statements in the dump."""
+    seeds = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            match = _ROW.match(line.strip())
+            if not match:
+                continue
+            content = match.group(2).replace("''", "'").replace("\\'", "'")
+            vector = np.array([float(x) for x in match.group(3)[1:-1].split(",")], dtype=np.float32)
+            seeds.append({
+                "content": content,
+                "vector": vector / np.linalg.norm(vector),
+                "teacher_name": match.group(6),
+            })
+    if not seeds:
+        raise ValueError(f"no documents rows found in {path}")
+    return seeds
+
+
+class Corpus:
+    """
+    A sequence of documents rows with ids 1..size, plus any rows appended by
+    inserts. Scopes cycle through years x rooms_per_year x subjects.
+    """
+
+    def __init__(self, size, rooms_per_year=10, noise=0.05, storage_format="float32", seed=0, seeds=None):
+        self.size = size
+        self.rooms_per_year = rooms_per_year
+        self.noise = noise
+        self.storage_format = storage_format
+        self.seed = seed
+        self.seeds = seeds or load_seed()
+        self.extra = []
+
+    @property
+    def dimension(self):
+        return len(self.seeds[0]["vector"])
+
+    def scope(self, i):
+        year = 1 + i % 6
+        room = year * 100 + 1 + (i // 6) % self.rooms_per_year
+        subject = SUBJECTS[(i // (6 * self.rooms_per_year)) % len(SUBJECTS)]
+        return year, room, subject
+
+    def scopes(self):
+        return sorted({self.scope(i) for i in range(min(self.size, 6 * self.rooms_per_year * len(SUBJECTS)))})
+
+    def vector(self, i):
+        base = self.seeds[i % len(self.seeds)]["vector"]
+        rng = np.random.default_rng(self.seed * 1_000_003 + i)
+        vector = base + rng.normal(0, self.noise, len(base)).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def row(self, i):
+        seed = self.seeds[i % len(self.seeds)]
+        year, room, subject = self.scope(i)
+        return {
+            "id": i + 1,
+            "content": f"{seed['content']} (บันทึกที่ {i + 1})",
+            "embedding": encode_embedding(self.vector(i), self.storage_format),
+            "created_at": f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            "time_of_record": f"{8 + i % 8:02d}:{i % 60:02d}:00",
+            "teacher_name": seed["teacher_name"],
+            "teacher_subject": subject,
+            "student_year": year,
+            "student_room": room,
+        }
+
+    def __len__(self):
+        return self.size + len(self.extra)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if position < self.size:
+            return self.row(position)
+        return self.extra[position - self.size]
+
+    def append(self, row):
+        self.extra.append(row)
+
+    def queries(self, count, seed=1):
+        """Query texts: seed lessons cut to a question-sized prefix."""
+        rng = np.random.default_rng(seed)
+        texts = [s["content"] for s in self.seeds]
+        return [texts[j][:int(rng.integers(20, 60))] for j in rng.integers(0, len(texts), count)]
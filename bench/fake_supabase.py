@@ -0,0 +1,271 @@
+"""
+In-memory stand-in for the parts of the Supabase client the API uses:
+table().select/insert/update with eq/is_/gt/gte/lt/lte/in_/order/limit,
+select(count='exact', head=True) and rpc('match_documents').
+
+FakeSupabase is the sync client, FakeSupabase.async_client() an async view
+of the same tables. latency adds a sleep per round trip.
+"""
+import asyncio
+import bisect
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from embedding_codec import decode_embedding  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _compare(op, value, target):
+    if op == "is":
+        return value is None if target in (None, "null") else value == target
+    if value is None:
+        return False
+    if op == "eq":
+        return value == target
+    if op == "neq":
+        return value != target
+    if op == "gt":
+        return value > target
+    if op == "gte":
+        return value >= target
+    if op == "lt":
+        return value < target
+    if op == "lte":
+        return value <= target
+    if op == "in":
+        return value in target
+    raise ValueError(op)
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.action = "select"
+        self.columns = None
+        self.count = None
+        self.head = False
+        self.payload = None
+        self.filters = []
+        self.order_by = None
+        self.limit_n = None
+
+    def select(self, columns="*", count=None, head=False):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        self.count = count
+        self.head = head
+        return self
+
+    def insert(self, rows):
+        self.action, self.payload = "insert", rows
+        return self
+
+    def update(self, values):
+        self.action, self.payload = "update", values
+        return self
+
+    def _filter(self, op, column, value):
+        self.filters.append((op, column, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter("eq", column, value)
+
+    def neq(self, column, value):
+        return self._filter("neq", column, value)
+
+    def gt(self, column, value):
+        return self._filter("gt", column, value)
+
+    def gte(self, column, value):
+        return self._filter("gte", column, value)
+
+    def lt(self, column, value):
+        return self._filter("lt", column, value)
+
+    def lte(self, column, value):
+        return self._filter("lte", column, value)
+
+    def is_(self, column, value):
+        return self._filter("is", column, value)
+
+    def in_(self, column, values):
+        return self._filter("in", column, list(values))
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    def execute(self):
+        time.sleep(self.client.latency)
+        return self.client._run(self)
+
+
+class AsyncFakeQuery(FakeQuery):
+    async def execute(self):
+        await asyncio.sleep(self.client.latency)
+        return self.client._run(self)
+
+
+class FakeRpc:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        time.sleep(self.client.latency)
+        return self.client._rpc(self.name, self.params)
+
+
+class AsyncFakeRpc(FakeRpc):
+    async def execute(self):
+        await asyncio.sleep(self.client.latency)
+        return self.client._rpc(self.name, self.params)
+
+
+class FakeSupabase:
+    query_class = FakeQuery
+    rpc_class = FakeRpc
+
+    def __init__(self, tables=None, latency=0.0):
+        # a table is any sequence of rows sorted by id that supports append (list, bench.corpus.Corpus)
+        self.tables = tables if tables is not None else {}
+        self.latency = latency
+        self._lock = threading.RLock()
+        self._matrix_cache = {}
+
+    def async_client(self):
+        view = AsyncFakeSupabase.__new__(AsyncFakeSupabase)
+        view.__dict__ = self.__dict__  # same tables, lock and settings
+        return view
+
+    def table(self, name):
+        return self.query_class(self, name)
+
+    def rpc(self, name, params):
+        return self.rpc_class(self, name, params)
+
+    def _rows(self, query):
+        rows = self.tables.setdefault(query.table, [])
+        filters = query.filters
+        start = 0
+        # ids only grow, so "id > x ORDER BY id" pages start with a binary search
+        if filters and filters[0][:2] == ("gt", "id") and query.order_by in (None, ("id", False)):
+            start = bisect.bisect_right(rows, filters[0][2], key=lambda row: row["id"])
+            filters = filters[1:]
+        # rows are stored in id order, a limit without another ordering can stop early
+        id_ordered = query.order_by in (None, ("id", False))
+        stop = query.limit_n if id_ordered and not query.count else None
+        matched = []
+        for position in range(start, len(rows)):
+            row = rows[position]
+            if all(_compare(op, row.get(column), value) for op, column, value in filters):
+                matched.append(row)
+                if stop is not None and len(matched) >= stop:
+                    break
+        if not id_ordered:
+            column, desc = query.order_by
+            matched.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        return matched
+
+    def _project(self, row, columns):
+        return dict(row) if columns is None else {c: row.get(c) for c in columns}
+
+    def _run(self, query):
+        with self._lock:
+            rows = self.tables.setdefault(query.table, [])
+            if query.action == "insert":
+                payload = query.payload if isinstance(query.payload, list) else [query.payload]
+                inserted = []
+                next_id = (rows[-1]["id"] + 1) if len(rows) else 1
+                for item in payload:
+                    row = dict(item, id=next_id)
+                    row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+                    rows.append(row)
+                    inserted.append(dict(row))
+                    next_id += 1
+                self._matrix_cache.pop(query.table, None)
+                return FakeResponse(inserted)
+            if query.head and not query.filters:
+                return FakeResponse([], len(rows))
+            matched = self._rows(query)
+            if query.action == "update":
+                for row in matched:
+                    row.update(query.payload)
+                self._matrix_cache.pop(query.table, None)
+                return FakeResponse([dict(row) for row in matched])
+            count = len(matched) if query.count else None
+            if query.head:
+                return FakeResponse([], count)
+            if query.limit_n is not None:
+                matched = matched[:query.limit_n]
+            return FakeResponse([self._project(row, query.columns) for row in matched], count)
+
+    def _documents_matrix(self, rows):
+        """Normalized embeddings and scope columns of the documents table, rebuilt after writes."""
+        cached = self._matrix_cache.get("documents")
+        if cached is None or cached["rows"] != len(rows):
+            all_rows = rows[:]
+            matrix = np.stack([decode_embedding(row["embedding"]) for row in all_rows]) if all_rows else np.zeros((0, 1))
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            cached = self._matrix_cache["documents"] = {
+                "rows": len(all_rows),
+                "matrix": matrix,
+                "year": np.array([row["student_year"] for row in all_rows]),
+                "room": np.array([row["student_room"] for row in all_rows]),
+                "subject": np.array([row["teacher_subject"] for row in all_rows], dtype=object),
+            }
+        return cached
+
+    def _rpc(self, name, params):
+        if name != "match_documents":
+            raise ValueError(f"unknown function {name}")
+        with self._lock:
+            rows = self.tables.setdefault("documents", [])
+            cached = self._documents_matrix(rows)
+        candidates = np.arange(cached["rows"])
+        for key in ("year", "room", "subject"):
+            value = params.get(f"filter_{key}")
+            if value is not None:
+                candidates = candidates[cached[key][candidates] == value]
+        query = np.asarray(params["query_embedding"], dtype=np.float32)
+        scores = cached["matrix"][candidates] @ (query / max(np.linalg.norm(query), 1e-12))
+        hits = []
+        for position in np.argsort(-scores)[:params.get("match_count", 5)]:
+            row = rows[int(candidates[position])]
+            hit = {k: v for k, v in row.items() if k not in ("embedding", "embedding_vec")}
+            hit["similarity"] = float(scores[position])
+            hits.append(hit)
+        return FakeResponse(hits)
+
+
+class AsyncFakeSupabase(FakeSupabase):
+    query_class = AsyncFakeQuery
+    rpc_class = AsyncFakeRpc
+
+
+def install(func, tables, latency=0.0):
+    """Points func's sync and async Supabase clients at in-memory tables."""
+    tables.setdefault("setting", [{"id": 1, "content": "system", "status": "on"}])
+    tables.setdefault("teacher", [{"id": 1, "teacher_name": "อาจารย์สมชาย"}])
+    client = FakeSupabase(tables, latency)
+    func.supabase = client
+    func._async_supabase = client.async_client()
+    func.settings_cache.invalidate()
+    return client
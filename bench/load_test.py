@@ -0,0 +1,120 @@
+"""
+HTTP load test for a running toth_api (bench/serve.py or a real deployment).
+
+run with
+python bench/load_test.py --endpoint fetch-gemini --concurrency 32 --requests 1000
+python bench/load_test.py --endpoint fetch-response --stream --duration 60 --output bench_results.jsonl
+
+Questions come from the seed lessons and each request is asked in a random
+class scope of the synthetic corpus. Reports latency p50/p95/p99, requests
+per second and status counts; with --stream also the time to first byte.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+import httpx
+
+from common import latency_stats, write_results
+from corpus import Corpus
+
+ENDPOINTS = ["fetch-response", "fetch-gemini", "add-document", "health", "school-data", "metrics"]
+
+
+def build_request(endpoint, question, scope, stream, k):
+    year, room, subject = scope
+    if endpoint in ("fetch-response", "fetch-gemini"):
+        return "POST", f"/{endpoint}", {"prompt": question, "k": k, "room_id": room, "year_id": year,
+                                        "subject_id": subject, "stream": stream}
+    if endpoint == "add-document":
+        return "POST", "/add-document", {"content": {
+            "content": question, "time_summit": "2025-09-01T09:00:00Z", "time_of_record": "09:30:00",
+            "teacher_name": "อาจารย์ทดสอบ", "teacher_subject": subject, "student_year": year, "student_room": room}}
+    return "GET", f"/{endpoint}", None
+
+
+async def one_request(client, method, path, body):
+    """Returns (status, seconds to first body byte, seconds until the body is read)."""
+    start = time.perf_counter()
+    first_byte = None
+    async with client.stream(method, path, json=body) as response:
+        async for _ in response.aiter_raw():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+        return response.status_code, first_byte, time.perf_counter() - start
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    corpus = Corpus(args.rows, rooms_per_year=args.rooms_per_year)
+    scopes = corpus.scopes()
+    questions = corpus.queries(max(args.requests or 0, 1000), seed=args.seed)
+    durations, first_bytes, statuses, errors = [], [], Counter(), Counter()
+    sent = 0
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def next_request():
+        nonlocal sent
+        if deadline is not None:
+            if time.perf_counter() >= deadline:
+                return None
+        elif sent >= args.requests:
+            return None
+        sent += 1
+        return build_request(args.endpoint, questions[sent % len(questions)], rng.choice(scopes), args.stream, args.k)
+
+    async def worker(client):
+        while (request := next_request()) is not None:
+            method, path, body = request
+            try:
+                status, first_byte, total = await one_request(client, method, path, body)
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] += 1
+                continue
+            statuses[str(status)] += 1
+            durations.append(total)
+            if first_byte is not None:
+                first_bytes.append(first_byte)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    results = {
+        "elapsed_seconds": round(elapsed, 3),
+        "latency": latency_stats(durations, elapsed),
+        "status": dict(statuses),
+        "errors": dict(errors),
+    }
+    if args.stream:
+        results["first_byte"] = latency_stats(first_bytes)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8700")
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="fetch-gemini")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--duration", type=float, help="run for this many seconds instead of --requests")
+    parser.add_argument("--stream", action="store_true", help="ask for SSE answers")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=10000, help="--rows of the served corpus, for its scopes")
+    parser.add_argument("--rooms-per-year", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="append the results as a JSON line to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    write_results("load_test", config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Local stand-in for the Gemini and Ollama APIs, for trying the API without a
+key or a GPU, checking retries, timeouts and the Ollama fallback, and
+benchmarking with a fixed model latency.
+
+run with
+python bench/mock_llm.py --port 8701
+python bench/mock_llm.py --latency 0.5 --error-rate 0.3
+and start the API with GEMINI_BASE_URL=http://127.0.0.1:8701/v1beta APIKEYS=mock
+OLLAMA_HOST=http://127.0.0.1:8701
+
+Serves POST /v1beta/models/<model>:generateContent and
+:streamGenerateContent?alt=sse, Ollama's POST /api/chat (NDJSON when
+streaming) and GET /api/tags. Requests asking for JSON output get a
+valid 5 question quiz.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "ลองทบทวนเนื้อหาที่ครูสอนในคาบนี้ดูนะ ข้อมูลสำคัญคืออะไร แล้วลองเชื่อมโยงกับคำถามดูสิ"
+
+
+def quiz():
+    return json.dumps([
+        {
+            "question": f"คำถามที่ {i}",
+            "choices": {"a": f"ตัวเลือก {i}a", "b": f"ตัวเลือก {i}b", "c": f"ตัวเลือก {i}c", "d": f"ตัวเลือก {i}d"},
+            "correct": random.choice("abcd"),
+        }
+        for i in range(1, 6)
+    ], ensure_ascii=False)
+
+
+def candidate(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+
+def ollama_message(model, text, done=True):
+    return {
+        "model": model,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "message": {"role": "assistant", "content": text},
+        "done": done,
+    }
+
+
+def chunks(text):
+    words = text.split(" ")
+    return [word if i == len(words) - 1 else word + " " for i, word in enumerate(words)]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = None
+
+    def log_message(self, format, *args):
+        if not self.options.quiet:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith("/api/tags"):
+            return self.send_json(200, {"models": [{"name": "Mistral:latest", "model": "Mistral:latest"}]})
+        if self.path.startswith("/api/version"):
+            return self.send_json(200, {"version": "mock"})
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.options.latency)
+
+        if random.random() < self.options.error_rate:
+            status = random.choice([429, 503])
+            return self.send_json(status, {"error": {"code": status, "message": "mock failure"}})
+        if self.path.startswith("/api/chat"):
+            return self.ollama_chat(request)
+        if not self.headers.get("X-goog-api-key"):
+            return self.send_json(403, {"error": {"code": 403, "message": "missing API key"}})
+
+        json_output = request.get("generationConfig", {}).get("responseMimeType") == "application/json"
+        text = quiz() if json_output else ANSWER
+        if ":streamGenerateContent" not in self.path:
+            return self.send_json(200, candidate(text))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for chunk in chunks(text):
+            self.wfile.write(f"data: {json.dumps(candidate(chunk), ensure_ascii=False)}\r\n\r\n".encode())
+            self.wfile.flush()
+            time.sleep(self.options.token_delay)
+        self.close_connection = True
+
+    def ollama_chat(self, request):
+        model = request.get("model", "Mistral")
+        text = quiz() if request.get("format") == "json" else ANSWER
+        if not request.get("stream", True):
+            return self.send_json(200, ollama_message(model, text))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for chunk in chunks(text):
+            self.wfile.write((json.dumps(ollama_message(model, chunk, done=False), ensure_ascii=False) + "\n").encode())
+            self.wfile.flush()
+            time.sleep(self.options.token_delay)
+        self.wfile.write((json.dumps(ollama_message(model, ""), ensure_ascii=False) + "\n").encode())
+        self.close_connection = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8701)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before each response")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/503")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    Handler.options = args
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"mock Gemini on http://{args.host}:{args.port}/v1beta, mock Ollama on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Runs toth_api on a synthetic corpus with the in-memory Supabase stand-in and
+the mock Gemini/Ollama server, for load testing without outside services.
+
+run with
+python bench/serve.py --rows 100000 --llm-latency 0.5
+python bench/load_test.py --url http://127.0.0.1:8700 --endpoint fetch-gemini
+
+The embedding model is the real one (EMBEDDING_MODEL), so /fetch-* requests
+pay the same query embedding cost as in production.
+"""
+import argparse
+
+from common import bench_env, start_mock_llm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--rooms-per-year", type=int, default=10)
+    parser.add_argument("--db-latency", type=float, default=0.0, help="seconds added to each Supabase round trip")
+    parser.add_argument("--llm-port", type=int, default=8701)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds before each mock model response")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed chunks")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--no-preload", action="store_true", help="build the vector index on the first query")
+    args = parser.parse_args()
+
+    llm_url = start_mock_llm(args.llm_port, args.llm_latency, args.token_delay, args.llm_error_rate)
+    bench_env(llm_url)
+    import uvicorn
+
+    import fake_supabase
+    import func
+    import toth_api
+    from corpus import Corpus
+
+    corpus = Corpus(args.rows, rooms_per_year=args.rooms_per_year, storage_format=func.EMBEDDING_STORAGE_FORMAT)
+    fake_supabase.install(func, {"documents": corpus}, latency=args.db_latency)
+    if not args.no_preload and func.RETRIEVAL_MODE == "local":
+        func.load_index()
+    print(f"mock LLM on {llm_url}, {len(corpus)} documents, scopes e.g. {corpus.scopes()[:3]}")
+    uvicorn.run(toth_api.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import re
+
+# pythainlp's sent_tokenize, imported on first use (slow import), False when not installed
+_sent_tokenize = None
+
+# Thai has no sentence punctuation, clauses are separated by spaces. Latin text
+# ends sentences with .!? followed by a space.
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+|(?<=[฀-๿])\s+(?=[฀-๿])")
+
+
+def _sentence_splitter():
+    global _sent_tokenize
+    if _sent_tokenize is None:
+        try:
+            from pythainlp.tokenize import sent_tokenize
+        except ImportError:  # optional, better Thai sentence boundaries
+            sent_tokenize = False
+        _sent_tokenize = sent_tokenize
+    return _sent_tokenize
+
+
+def split_sentences(text):
+    sent_tokenize = _sentence_splitter()
+    if sent_tokenize:
+        sentences = sent_tokenize(text, engine="crfcut")
+    else:
+        sentences = _SENTENCE_BREAK.split(text)
+    return [s.strip() for s in sentences if s and s.strip()]
+
+
+def _hard_split(sentence, max_chars):
+    return [sentence[i:i + max_chars] for i in range(0, len(sentence), max_chars)]
+
+
+def chunk_text(text, max_chars=400, overlap_chars=80):
+    """
+    Splits text into passages of at most max_chars, cut on sentence boundaries.
+    Each passage starts with the last sentences (up to overlap_chars) of the
+    previous one so a fact split across the boundary stays retrievable.
+
+    Returns (passage, overlap) pairs where overlap is the number of leading
+    characters repeated from the previous passage. Returns [(text, 0)] when
+    the text already fits in one passage.
+    """
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [(text, 0)] if text else []
+
+    sentences = []
+    for sentence in split_sentences(text):
+        sentences.extend(_hard_split(sentence, max_chars) if len(sentence) > max_chars else [sentence])
+
+    passages = []
+    current = []
+    length = 0
+    carried = 0
+    for sentence in sentences:
+        if current and length + len(sentence) + 1 > max_chars:
+            passages.append((" ".join(current), carried))
+            # carry the tail of this passage into the next one
+            overlap = []
+            overlap_length = 0
+            for previous in reversed(current):
+                if overlap_length + len(previous) + 1 > overlap_chars:
+                    break
+                overlap.insert(0, previous)
+                overlap_length += len(previous) + 1
+            if overlap_length + len(sentence) + 1 > max_chars:
+                overlap, overlap_length = [], 0
+            current, length, carried = overlap, overlap_length, overlap_length
+        current.append(sentence)
+        length += len(sentence) + 1
+    if current:
+        passages.append((" ".join(current), carried))
+    return passages
+
+
+def merge_passages(passages):
+    """
+    Joins consecutive (passage, overlap) pairs of one document, dropping the
+    text each one repeats from the previous passage.
+    """
+    merged = passages[0][0]
+    for passage, overlap in passages[1:]:
+        if overlap < len(passage):
+            merged += " " + passage[overlap:]
+    return merged
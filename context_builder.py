@@ -0,0 +1,96 @@
+import math
+import re
+
+import numpy as np
+
+_THAI = re.compile(r"[฀-๿]")
+
+
+def estimate_tokens(text):
+    """
+    Rough token count without loading a tokenizer: Thai script costs about one
+    token per 2 characters in both Gemini and Mistral tokenizers, other text
+    about one token per 4 characters.
+    """
+    thai = len(_THAI.findall(text))
+    return math.ceil(thai / 2 + (len(text) - thai) / 4)
+
+
+def format_document(doc):
+    return f"Content: {doc[1]}\nผู้สอน: {doc[4]} ({doc[5]})\nเวลาที่สอน/บันทึก: {doc[2]} {doc[3]}"
+
+
+def _truncate(text, max_tokens):
+    # cut proportionally, then trim until it fits
+    if max_tokens <= 0:
+        return ""
+    cut = int(len(text) * max_tokens / max(estimate_tokens(text), 1))
+    while cut > 0 and estimate_tokens(text[:cut]) > max_tokens:
+        cut -= max(1, cut // 20)
+    return text[:cut]
+
+
+def build_context(docs, token_budget, vectors=None, dedupe_threshold=0.92, min_score_ratio=0.5,
+                  keyword_matches=None):
+    """
+    Builds the prompt context from retrieved docs (best first) within
+    token_budget.
+
+    - docs scoring below min_score_ratio * the highest score are dropped,
+      except those flagged in keyword_matches: a BM25 hit can have a low
+      cosine similarity and still be the exact answer
+    - docs whose retrieval vector has cosine >= dedupe_threshold with an
+      already kept doc are dropped (exact duplicate text when vectors is None)
+    - docs are added until the budget is used, the first one is truncated
+      if it alone is over budget
+
+    Returns (context, stats) where stats counts tokens used and saved.
+    """
+    entries = [format_document(doc) for doc in docs]
+    stats = {
+        "documents": len(docs),
+        "dropped_low_score": 0,
+        "dropped_duplicate": 0,
+        "dropped_budget": 0,
+        "tokens_before": sum(estimate_tokens(e) for e in entries),
+        "tokens_used": 0,
+    }
+
+    # docs can be ordered by something else than their score (hybrid retrieval)
+    best = max((doc[0] for doc in docs), default=0)
+    kept = []
+    kept_vectors = []
+    kept_texts = set()
+    used = 0
+    for i, (doc, entry) in enumerate(zip(docs, entries)):
+        keyword_match = keyword_matches is not None and keyword_matches[i]
+        if kept and best > 0 and doc[0] < best * min_score_ratio and not keyword_match:
+            stats["dropped_low_score"] += 1
+            continue
+
+        vector = vectors[i] if vectors is not None else None
+        if vector is not None and kept_vectors:
+            if float(np.max(np.stack(kept_vectors) @ vector)) >= dedupe_threshold:
+                stats["dropped_duplicate"] += 1
+                continue
+        elif vector is None and doc[1] in kept_texts:
+            stats["dropped_duplicate"] += 1
+            continue
+
+        tokens = estimate_tokens(entry)
+        if used + tokens > token_budget:
+            if kept:
+                stats["dropped_budget"] += 1
+                continue
+            entry = _truncate(entry, token_budget)
+            tokens = estimate_tokens(entry)
+
+        kept.append(entry)
+        kept_texts.add(doc[1])
+        if vector is not None:
+            kept_vectors.append(vector)
+        used += tokens
+
+    stats["tokens_used"] = used
+    stats["tokens_saved"] = stats["tokens_before"] - used
+    return "\n\n".join(kept), stats
@@ -0,0 +1,26 @@
+-- Passages of long lesson transcripts
+--
+-- add_document splits documents longer than PASSAGE_MAX_CHARS into overlapping
+-- passages (see chunking.py) and stores one row per passage here. Retrieval
+-- ranks passages and merges neighbouring ones of the same document instead of
+-- sending whole transcripts to the LLM. Documents without passages are still
+-- retrieved whole. Existing documents can be split with:
+--   python ingest_documents.py --backfill-passages
+
+CREATE TABLE IF NOT EXISTS document_passages (
+  id bigserial PRIMARY KEY,
+  document_id bigint NOT NULL REFERENCES documents (id) ON DELETE CASCADE,
+  passage_index int NOT NULL,
+  -- number of leading characters repeated from the previous passage
+  overlap int NOT NULL DEFAULT 0,
+  content text NOT NULL,
+  embedding text NOT NULL,
+  -- copied from the parent document so passages partition like documents
+  created_at timestamp NOT NULL,
+  time_of_record time NOT NULL,
+  teacher_name text NOT NULL,
+  teacher_subject text NOT NULL,
+  student_year int NOT NULL,
+  student_room int NOT NULL,
+  UNIQUE (document_id, passage_index)
+);
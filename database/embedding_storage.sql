@@ -0,0 +1,14 @@
+-- Compact embedding storage
+--
+-- add_document now writes documents.embedding as "<format>:<base64>" text
+-- (see embedding_codec.py) instead of a JSON list. The column has to accept
+-- plain text before new rows are inserted; readers still accept the old JSON.
+-- Run migrate_embeddings.py afterwards to convert the existing rows.
+
+-- Supabase / Postgres (when the column was created as json/jsonb)
+ALTER TABLE documents
+  ALTER COLUMN embedding TYPE text USING embedding #>> '{}';
+
+-- MariaDB (database/documents.sql): drop the json_valid check
+-- ALTER TABLE `documents`
+--   MODIFY `embedding` longtext CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL;
@@ -0,0 +1,77 @@
+"""
+Rewrites documents.embedding into a compact storage format.
+
+run with
+python database/migrate_embeddings.py --format float32
+python database/migrate_embeddings.py --format int8 --dry-run
+python database/migrate_embeddings.py --pgvector   (also fill embedding_vec, see pgvector_search.sql)
+"""
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from embedding_codec import FORMATS, encode_embedding, decode_embedding  # noqa: E402
+
+
+def migrate(supabase, fmt, page_size=500, dry_run=False, pgvector=False):
+    last_id = 0
+    converted = 0
+    skipped = 0
+    before = 0
+    after = 0
+    while True:
+        response = supabase.table('documents').select('id, embedding').gt(
+            'id', last_id).order('id').limit(page_size).execute()
+        rows = response.data
+        for row in rows:
+            last_id = row['id']
+            try:
+                vector = decode_embedding(row['embedding'])
+                encoded = encode_embedding(vector, fmt)
+            except Exception as e:
+                print(f"Skipping document {row['id']}: {e}")
+                skipped += 1
+                continue
+            update = {}
+            if encoded != row['embedding']:
+                update['embedding'] = encoded
+                before += len(row['embedding'])
+                after += len(encoded)
+            if pgvector:
+                update['embedding_vec'] = vector.tolist()
+            if not update:
+                skipped += 1
+                continue
+            if not dry_run:
+                supabase.table('documents').update(update).eq('id', row['id']).execute()
+            converted += 1
+        if len(rows) < page_size:
+            break
+
+    print(f"Updated {converted} rows ({fmt}{', embedding_vec' if pgvector else ''}), skipped {skipped}"
+          + (" (dry run)" if dry_run else ""))
+    if after:
+        print(f"Embedding payload: {before} -> {after} bytes ({before / after:.1f}x smaller)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--format", choices=FORMATS, default="float32")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only report what would change")
+    parser.add_argument("--pgvector", action="store_true",
+                        help="also fill the embedding_vec column used by RETRIEVAL_MODE=database")
+    args = parser.parse_args()
+
+    load_dotenv()
+    supabase = create_client(os.getenv("PUBLIC_SUPABASE_URL"), os.getenv("PUBLIC_SUPABASE_ANON_KEY"))
+    migrate(supabase, args.format, args.page_size, args.dry_run, args.pgvector)
+
+
+if __name__ == "__main__":
+    main()
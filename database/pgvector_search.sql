@@ -0,0 +1,86 @@
+-- Server-side similarity search with pgvector (RETRIEVAL_MODE=database)
+--
+-- Adds a vector copy of documents.embedding with an HNSW index and a
+-- match_documents() function that returns only the top-k rows with scores,
+-- so the API no longer downloads every candidate row. Fill the new column
+-- for existing rows with:
+--   python database/migrate_embeddings.py --pgvector
+-- The dimension must match EMBEDDING_MODEL (384 for all-MiniLM-L6-v2).
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+ALTER TABLE documents
+  ADD COLUMN IF NOT EXISTS embedding_vec vector(384);
+
+CREATE INDEX IF NOT EXISTS documents_embedding_vec_hnsw
+  ON documents USING hnsw (embedding_vec vector_cosine_ops);
+
+-- Filters are applied next to the vector scan, keep them indexed too
+CREATE INDEX IF NOT EXISTS documents_scope_idx
+  ON documents (student_year, student_room, teacher_subject);
+
+-- An HNSW scan only returns the hnsw.ef_search nearest rows and the class
+-- filters are applied afterwards, so a query scoped to one class among
+-- hundreds could come back with fewer than match_count rows. Iterative scans
+-- (pgvector >= 0.8) keep scanning the graph until enough rows pass the
+-- filters; relaxed_order may return them slightly out of order, the outer
+-- query sorts them again. On pgvector < 0.8 remove the iterative_scan line
+-- and raise ef_search instead (it is an upper bound on the rows scanned).
+CREATE OR REPLACE FUNCTION match_documents(
+  query_embedding vector(384),
+  match_count int DEFAULT 5,
+  filter_year int DEFAULT NULL,
+  filter_room int DEFAULT NULL,
+  filter_subject text DEFAULT NULL
+)
+RETURNS TABLE (
+  id bigint,
+  content text,
+  created_at text,
+  time_of_record text,
+  teacher_name text,
+  teacher_subject text,
+  student_year int,
+  student_room int,
+  similarity float
+)
+LANGUAGE sql STABLE
+SET hnsw.iterative_scan = relaxed_order
+SET hnsw.ef_search = 100
+AS $$
+  WITH hits AS MATERIALIZED (
+    SELECT
+      d.id,
+      d.content,
+      d.created_at::text AS created_at,
+      d.time_of_record::text AS time_of_record,
+      d.teacher_name,
+      d.teacher_subject,
+      d.student_year,
+      d.student_room,
+      d.embedding_vec <=> query_embedding AS distance
+    FROM documents d
+    WHERE d.embedding_vec IS NOT NULL
+      AND (filter_year IS NULL OR d.student_year = filter_year)
+      AND (filter_room IS NULL OR d.student_room = filter_room)
+      AND (filter_subject IS NULL OR d.teacher_subject = filter_subject)
+    ORDER BY d.embedding_vec <=> query_embedding
+    LIMIT match_count
+  )
+  SELECT
+    hits.id,
+    hits.content,
+    hits.created_at,
+    hits.time_of_record,
+    hits.teacher_name,
+    hits.teacher_subject,
+    hits.student_year,
+    hits.student_room,
+    1 - hits.distance AS similarity
+  FROM hits
+  ORDER BY hits.distance;
+$$;
+
+-- IVFFlat alternative for very large tables (build after the data is loaded):
+-- CREATE INDEX documents_embedding_vec_ivfflat
+--   ON documents USING ivfflat (embedding_vec vector_cosine_ops) WITH (lists = 100);
@@ -0,0 +1,27 @@
+-- Precomputed quizzes
+--
+-- Quiz jobs (POST /quiz-jobs) store each finished quiz here so students fetch
+-- it with GET /quiz instead of waiting for a Gemini call.
+
+CREATE TABLE IF NOT EXISTS quizzes (
+  id bigserial PRIMARY KEY,
+  created_at timestamptz NOT NULL DEFAULT now(),
+  student_year int,
+  student_room int,
+  teacher_subject text,
+  -- [{"question": ..., "choices": {"a": ..., "b": ..., "c": ..., "d": ...}, "correct": "a"}]
+  questions jsonb NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS quizzes_scope_idx
+  ON quizzes (student_year, student_room, teacher_subject, created_at DESC);
+
+-- Status of the quiz jobs, so GET /quiz-jobs/{id} works on every API worker
+CREATE TABLE IF NOT EXISTS quiz_jobs (
+  id text PRIMARY KEY,
+  status text NOT NULL,
+  created_at timestamptz NOT NULL DEFAULT now(),
+  finished_at timestamptz,
+  -- [{"year_id": ..., "room_id": ..., "subject_id": ..., "status": ..., "quiz_id": ..., "error": ...}]
+  scopes jsonb NOT NULL
+);
@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import queue
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class EmbeddingService:
+    """
+    Owns the one SentenceTransformer instance shared by every path in func.py.
+
+    The model is loaded once (with a warm-up pass) and single-text encode calls
+    coming from concurrent requests are grouped by a worker thread into one
+    batched forward pass. torch and sentence-transformers are only imported by
+    load(), so importing this module is cheap.
+
+    backend is "torch", "onnx" or "openvino" (sentence-transformers >= 3.2);
+    model_file picks one file of the model repo, e.g. a quantized
+    "onnx/model_qint8_avx512.onnx".
+    """
+
+    def __init__(self, model_name, device="cpu", threads=None, batch_size=32, batch_wait_ms=5,
+                 backend="torch", model_file=None):
+        self.model_name = model_name
+        self.device = device
+        self.threads = threads
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.backend = backend
+        self.model_file = model_file
+        self.model = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    def load(self):
+        """
+        Loads the model if it is not loaded yet and warms it up.
+        Safe to call from several threads, only the first call does the work.
+        """
+        if self.model is not None:
+            return self.model
+        with self._lock:
+            if self.model is not None:
+                return self.model
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            options = {}
+            if self.backend != "torch":
+                options["backend"] = self.backend
+            if self.model_file:
+                options["model_kwargs"] = {"file_name": self.model_file}
+            model = SentenceTransformer(self.model_name, device=self.device, **options)
+            # First forward pass allocates the kernels, do it before serving traffic
+            model.encode(["warm-up"], batch_size=1)
+            self.model = model
+            print(f"Embedding model loaded: {self.model_name} ({self.backend}) on {self.device}")
+        return self.model
+
+    def _start_worker(self):
+        # Threads don't survive fork: a model loaded before gunicorn --preload
+        # forks gets a new batching thread in each worker
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    @property
+    def dimension(self):
+        return self.load().get_sentence_embedding_dimension()
+
+    def encode(self, text):
+        """
+        Encodes one string (returns a 1-D float32 array) or a list of strings
+        (returns a 2-D float32 array). Single strings are micro-batched with
+        other concurrent callers.
+        """
+        self.load()
+        if isinstance(text, (list, tuple)):
+            return self.encode_batch(list(text))
+        self._start_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    async def encode_async(self, text):
+        """
+        Same as encode() for one string, but awaits the batching worker thread
+        instead of blocking the event loop.
+        """
+        if self.model is None:
+            await asyncio.to_thread(self.load)
+        self._start_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return await asyncio.wrap_future(future)
+
+    def encode_batch(self, texts):
+        """Encodes a list of strings directly, already batched by the caller."""
+        model = self.load()
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        vectors = model.encode(texts, batch_size=self.batch_size,
+                               convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            texts = [text for text, _ in items]
+            try:
+                vectors = self.encode_batch(texts)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(items, vectors):
+                future.set_result(vector)
@@ -0,0 +1,54 @@
+import base64
+import json
+
+import numpy as np
+
+# Storage formats for documents.embedding. Binary formats are stored as
+# "<prefix>:<base64>" text so they fit the existing text column.
+FORMATS = ("json", "float32", "float16", "int8")
+_PREFIXES = {"float32": "f32", "float16": "f16", "int8": "i8"}
+_DTYPES = {"f32": np.float32, "f16": np.float16}
+
+
+def encode_embedding(vector, fmt="float32"):
+    """
+    Serializes one embedding for the documents.embedding column.
+    'json' keeps the legacy JSON list text, the others store base64 bytes.
+    int8 stores a float32 scale followed by the quantized values.
+    """
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    if fmt == "json":
+        return json.dumps(vector.tolist())
+    if fmt == "int8":
+        scale = float(np.abs(vector).max()) / 127.0 or 1.0
+        quantized = np.round(vector / scale).astype(np.int8)
+        payload = np.float32(scale).tobytes() + quantized.tobytes()
+    elif fmt in _PREFIXES:
+        payload = vector.astype(_DTYPES[_PREFIXES[fmt]]).tobytes()
+    else:
+        raise ValueError(f"Unknown embedding format: {fmt}")
+    return f"{_PREFIXES[fmt]}:{base64.b64encode(payload).decode('ascii')}"
+
+
+def decode_embedding(value):
+    """
+    Reads any stored embedding back as a 1-D float32 array: legacy JSON text,
+    a pgvector/JSON list, a Postgres bytea hex string or a prefixed base64 value.
+    """
+    if isinstance(value, (list, tuple)):
+        return np.asarray(value, dtype=np.float32)
+    if value.startswith("["):
+        return np.asarray(json.loads(value), dtype=np.float32)
+    if value.startswith("\\x"):
+        # bytea column, raw float32 bytes
+        return np.frombuffer(bytes.fromhex(value[2:]), dtype=np.float32)
+
+    prefix, _, data = value.partition(":")
+    payload = base64.b64decode(data)
+    if prefix == "i8":
+        scale = np.frombuffer(payload, dtype=np.float32, count=1)[0]
+        return np.frombuffer(payload, dtype=np.int8, offset=4).astype(np.float32) * scale
+    if prefix in _DTYPES:
+        vector = np.frombuffer(payload, dtype=_DTYPES[prefix])
+        return vector if prefix == "f32" else vector.astype(np.float32)
+    raise ValueError(f"Unknown embedding encoding: {prefix!r}")
@@ -1,37 +1,226 @@
-from supabase import create_client, Client
+import asyncio
 import json
+import logging
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-import ollama
-from sentence_transformers import SentenceTransformer, util
+import httpx
 from datetime import datetime, time
-import requests
 import os
+import threading
 from dotenv import load_dotenv
+from embedding import EmbeddingService
+from vector_index import VectorIndex, normalize
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from embedding_codec import encode_embedding, decode_embedding
+from settings_cache import SettingsCache
+from response_cache import ResponseCache, create_response_cache
+from chunking import chunk_text, merge_passages
+import context_builder
+from llm_scheduler import LLMScheduler, SchedulerBusy
+from llm_client import CircuitBreaker, CircuitOpen, FailoverClient, GeminiClient, LLMError, OllamaClient
+from health import HealthMonitor
+from quiz_jobs import QuizJobManager, repair_quiz_json, validate_quiz
+import metrics
+from metrics import span, UPSTREAM_ERRORS
 
 load_dotenv()
+metrics.configure_logging()
 
 
-# Connect to Supabase
+# Connect to Supabase, the clients are created on first use (importing supabase is slow)
 SUPABASE_URL = os.getenv("PUBLIC_SUPABASE_URL")
 SUPABASE_KEY = os.getenv("PUBLIC_SUPABASE_ANON_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Sync client for background threads (index sync, settings)
+supabase = None
+# Async client for the request path, created inside the event loop
+_async_supabase = None
+
+
+def get_supabase():
+    global supabase
+    if supabase is None:
+        from supabase import create_client
+        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return supabase
+
+
+async def get_async_supabase():
+    global _async_supabase
+    if _async_supabase is None:
+        from supabase import acreate_client
+        _async_supabase = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+    return _async_supabase
+
+
+# Pooled keep-alive HTTP client for Gemini and the async Ollama client
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", "60")), connect=10.0),
+    limits=httpx.Limits(max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+                        max_keepalive_connections=20),
+)
+#  OLLAMA_MODEL = "gemma:7b"
+#  OLLAMA_MODEL = "phi4-mini"
+OLLAMA_MODEL = "Mistral"
+# Bounded, room-fair admission in front of the local Ollama server
+ollama_scheduler = LLMScheduler(
+    max_concurrency=int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2")),
+    max_queue=int(os.getenv("OLLAMA_MAX_QUEUE", "32")),
+)
+OLLAMA_SYSTEM_PROMPT = "You are a helpful student assistant trained to explain academic content from class context only."
+
+# Gemini with retries and a circuit breaker, GEMINI_BASE_URL can point at bench/mock_llm.py
+gemini_llm = GeminiClient(
+    http_client,
+    os.getenv("APIKEYS", ""),
+    base_url=os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta"),
+    model=os.getenv("GEMINI_MODEL", "gemini-2.0-flash"),
+    timeout=float(os.getenv("GEMINI_TIMEOUT", "30")),
+    max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "3")),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("GEMINI_BREAKER_FAILURES", "5")),
+        reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET", "30")),
+    ),
+)
+ollama_llm = OllamaClient(OLLAMA_MODEL, ollama_scheduler, system=OLLAMA_SYSTEM_PROMPT,
+                          host=os.getenv("OLLAMA_HOST"), timeout=float(os.getenv("OLLAMA_TIMEOUT", "120")))
+# Gemini requests fall back to the local model when Gemini is down
+gemini_failover = FailoverClient(gemini_llm, ollama_llm if os.getenv("GEMINI_FALLBACK", "ollama") == "ollama" else None)
+GEMINI_ERROR_MESSAGE = "เกิดข้อผิดพลาดในการเรียกใช้ Gemini API"
+QUIZ_MAX_ATTEMPTS = int(os.getenv("QUIZ_MAX_ATTEMPTS", "2"))
+BUSY_MESSAGE = {"error": "busy", "details": "ขณะนี้มีผู้ใช้งานจำนวนมาก กรุณาลองใหม่อีกครั้งในอีกสักครู่"}
+
+
+async def close_clients():
+    """Closes the pooled HTTP connections on shutdown."""
+    await http_client.aclose()
+
+
+# Shared embedding model, loaded by warm_up() when the API starts (or on first use)
+embedder = EmbeddingService(
+    model_name=os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"),
+    device=os.getenv("EMBEDDING_DEVICE", "cpu"),
+    threads=int(os.getenv("EMBEDDING_THREADS", "0")) or None,
+    batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+    batch_wait_ms=float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5")),
+    backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+    model_file=os.getenv("EMBEDDING_MODEL_FILE") or None,
+)
+# Load at import so gunicorn --preload shares the weights with every forked worker
+if os.getenv("EMBEDDING_PRELOAD", "0") == "1":
+    embedder.load()
+
+
+# In-process vector index over the documents table, filled on first query
+DOCUMENT_COLUMNS = "id, content, embedding, created_at, time_of_record, teacher_name, teacher_subject, student_year, student_room"
+index = VectorIndex(ann_min_rows=int(os.getenv("VECTOR_INDEX_ANN_MIN_ROWS", "0")))
+_index_load_lock = threading.Lock()
+# BM25 over the same rows, fused with the vector ranking (local retrieval only)
+RETRIEVAL_HYBRID = os.getenv("RETRIEVAL_HYBRID", "0") == "1"
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+lexical_index = LexicalIndex() if RETRIEVAL_HYBRID else None
+# Highest documents.id / document_passages.id already in the index and when the index last caught up
+_index_sync = {"high_water_id": 0, "passage_high_water_id": 0, "last_sync": None}
+# Ids are taken at insert but rows only become visible at commit, so a lower id
+# can show up after a higher one was synced. Ids skipped within
+# INDEX_SYNC_LOOKBACK of the high-water mark are looked up again on every sync.
+INDEX_SYNC_LOOKBACK = int(os.getenv("INDEX_SYNC_LOOKBACK", "1000"))
+INDEX_SYNC_GAP_BATCH = 200  # ids per in_() request, keeps the URL short
+_index_sync_gaps = {"high_water_id": set(), "passage_high_water_id": set()}
+# Long documents are split into passages (database/document_passages.sql)
+PASSAGE_COLUMNS = "id, document_id, passage_index, overlap, content, embedding, created_at, time_of_record, teacher_name, teacher_subject, student_year, student_room"
+PASSAGE_CHUNKING = os.getenv("PASSAGE_CHUNKING", "1") == "1"
+PASSAGE_MAX_CHARS = int(os.getenv("PASSAGE_MAX_CHARS", "400"))
+PASSAGE_OVERLAP_CHARS = int(os.getenv("PASSAGE_OVERLAP_CHARS", "80"))
+PASSAGE_HITS_PER_DOCUMENT = int(os.getenv("PASSAGE_HITS_PER_DOCUMENT", "2"))
+# document id -> {passage_index: (content, overlap)} for documents indexed as passages
+_document_passages = {}
+INDEX_SYNC_INTERVAL = float(os.getenv("INDEX_SYNC_INTERVAL", "30"))
+_index_sync_stop = threading.Event()
+# Prompt context limits per LLM backend (estimated tokens)
+CONTEXT_TOKEN_BUDGET = {
+    "ollama": int(os.getenv("CONTEXT_TOKENS_OLLAMA", "1500")),
+    "gemini": int(os.getenv("CONTEXT_TOKENS_GEMINI", "6000")),
+}
+CONTEXT_DEDUPE_THRESHOLD = float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", "0.92"))
+CONTEXT_MIN_SCORE_RATIO = float(os.getenv("CONTEXT_MIN_SCORE_RATIO", "0.5"))
+# Running totals of the context builder, since process start
+context_totals = {"tokens_used": 0, "tokens_saved": 0, "dropped_duplicate": 0, "dropped_low_score": 0, "dropped_budget": 0}
+_context_totals_lock = threading.Lock()  # build_context runs in worker threads
+# Semantic cache of generated answers, None when RESPONSE_CACHE=off
+response_cache: ResponseCache = create_response_cache(
+    os.getenv("RESPONSE_CACHE", "memory"),
+    path=os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite3"),
+    threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95")),
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
+
+# Counters the components already keep, exported at /metrics
+metrics.REGISTRY.callback("toth_index_rows", "Documents and passages in the in-process vector index",
+                          "gauge", lambda: len(index))
+metrics.REGISTRY.callback("toth_index_rows_scanned_total", "Index rows compared against a query",
+                          "counter", lambda: index.rows_scanned)
+metrics.REGISTRY.callback("toth_response_cache_requests_total", "Semantic answer cache lookups", "counter",
+                          lambda: {("hit",): response_cache.hits, ("miss",): response_cache.misses} if response_cache else {},
+                          ("result",))
+metrics.REGISTRY.callback("toth_context_tokens_total", "Estimated prompt context tokens sent and saved", "counter",
+                          lambda: {("used",): context_totals["tokens_used"], ("saved",): context_totals["tokens_saved"]},
+                          ("kind",))
+metrics.REGISTRY.callback("toth_context_documents_dropped_total", "Retrieved documents left out of the prompt", "counter",
+                          lambda: {(reason,): context_totals[f"dropped_{reason}"] for reason in ("duplicate", "low_score", "budget")},
+                          ("reason",))
+metrics.REGISTRY.callback("toth_ollama_active", "Ollama generations running", "gauge", lambda: ollama_scheduler.active)
+metrics.REGISTRY.callback("toth_ollama_queued", "Requests waiting for an Ollama slot", "gauge", lambda: ollama_scheduler.queued)
+metrics.REGISTRY.callback("toth_ollama_rejected_total", "Requests turned away because the Ollama queue was full",
+                          "counter", lambda: ollama_scheduler.rejected)
+metrics.REGISTRY.callback("toth_ollama_coalesced_total", "Requests that shared an identical in-flight generation",
+                          "counter", lambda: ollama_scheduler.coalesced)
+metrics.REGISTRY.callback("toth_gemini_circuit_state", "1 for the current state of the Gemini circuit breaker", "gauge",
+                          lambda: {(state,): int(gemini_llm.breaker.state == state) for state in ("closed", "open", "half_open")},
+                          ("state",))
+# How add_document stores embeddings: json, float32, float16 or int8
+EMBEDDING_STORAGE_FORMAT = os.getenv("EMBEDDING_STORAGE_FORMAT", "float32")
+# Where similarity ranking happens: "local" (in-process index) or "database"
+# (match_documents pgvector RPC, see database/pgvector_search.sql)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "local")
+# Also write documents.embedding_vec on insert (on by default in database mode)
+PGVECTOR_WRITE = os.getenv("PGVECTOR_WRITE", "1" if RETRIEVAL_MODE == "database" else "0") == "1"
+
+
+def fetch_settings():
+    """
+    Loads the whole 'setting' table (content -> status) and the teacher list
+    in two round trips.
+    """
+    client = get_supabase()
+    response = client.table('setting').select('content, status').execute()
+    teacher = client.table('teacher').select('teacher_name').execute()
+    rows = response.data if hasattr(response, 'data') else response.get('data', [])
+    teachers = teacher.data if hasattr(teacher, 'data') else teacher.get('data', [])
+    return {
+        "settings": {row['content']: row['status'] for row in rows},
+        "teachers": [t['teacher_name'] for t in teachers]
+    }
+
+
+settings_cache = SettingsCache(
+    fetch_settings,
+    ttl=float(os.getenv("SETTINGS_CACHE_TTL", "5")),
+    max_stale=float(os.getenv("SETTINGS_CACHE_MAX_STALE", "60")),
+)
 
 
 # System check function
 def check_system():
     """
-    Fetches the 'setting' table and checks if the row with content='system' has status 'on'.
+    Checks the cached 'setting' table for the row with content='system' and status 'on'.
     Returns True if system is available, otherwise returns a string message.
     """
     try:
-        response = supabase.table('setting').select(
-            'status').eq('content', 'system').limit(1).execute()
-        data = response.data if hasattr(
-            response, 'data') else response.get('data', [])
-        if data and data[0].get('status', '').lower() == 'on':
+        status = settings_cache.get()["settings"].get('system')
+        if status and status.lower() == 'on':
             return True
-        elif data and data[0].get('status', '').lower() == 'off':
+        elif status and status.lower() == 'off':
             # return "system is not available please try again later or contact support"
             return {"error": "off", "details": "ระบบอยู่ระหว่างการปรับปรุง กรุณาลองใหม่ภายหลังหรือติดต่อฝ่ายผู้ดูแลระบบ"}
         else:
@@ -40,82 +229,504 @@ def check_system():
         return {"error": "exception", "details": f"system check error: {e}"}
 
 
-def qeury_database(query, k, roomId, yearId, subjectId):
-    system_status = check_system()
-    if system_status is not True:
-        return system_status
+def _row_meta(row):
+    return {key: value for key, value in row.items()
+            if key not in ('embedding', 'embedding_vec')}
+
+
+def _index_key(row):
+    return ("passage" if 'document_id' in row else "document", row['id'])
+
+
+def index_row(row):
+    """
+    Parses the stored embedding of one documents row and puts it in the
+    in-process vector index. Returns False if the embedding can't be parsed.
+    Documents already indexed as passages are skipped.
+    """
+    if row['id'] in _document_passages:
+        return True
+    try:
+        vector = decode_embedding(row['embedding'])
+    except Exception as e:
+        metrics.log_event("embedding_parse_error", logging.WARNING, id=row['id'], error=str(e))
+        return False
+    meta = _row_meta(row)
+    index.upsert(("document", row['id']), vector, meta)
+    if lexical_index is not None:
+        lexical_index.upsert(("document", row['id']), row['content'], meta)
+    return True
+
+
+def index_passage(row):
+    """
+    Puts one document_passages row in the index. The first passage of a
+    document replaces the whole-document entry.
+    """
+    try:
+        vector = decode_embedding(row['embedding'])
+    except Exception as e:
+        metrics.log_event("embedding_parse_error", logging.WARNING, passage_id=row['id'], error=str(e))
+        return False
+    passages = _document_passages.get(row['document_id'])
+    if passages is None:
+        passages = _document_passages[row['document_id']] = {}
+        index.remove(("document", row['document_id']), row)
+        if lexical_index is not None:
+            lexical_index.remove(("document", row['document_id']))
+    passages[row['passage_index']] = (row['content'], row['overlap'])
+    meta = _row_meta(row)
+    index.upsert(("passage", row['id']), vector, meta)
+    if lexical_index is not None:
+        lexical_index.upsert(("passage", row['id']), row['content'], meta)
+    return True
+
+
+def _fetch_rows_after(table, columns, last_id, page_size):
+    response = get_supabase().table(table).select(columns).gt(
+        'id', last_id).order('id').limit(page_size).execute()
+    return response.data if hasattr(response, 'data') else response["data"]
+
+
+def _fetch_rows_by_id(table, columns, ids):
+    response = get_supabase().table(table).select(columns).in_('id', ids).execute()
+    return response.data if hasattr(response, 'data') else response["data"]
+
+
+def _is_indexed(row):
+    if 'document_id' not in row and row['id'] in _document_passages:
+        return True
+    return index.get(_index_key(row), row) is not None
+
+
+def _sync_table(table, columns, mark, add_row, page_size):
+    gaps = _index_sync_gaps[mark]
+    added = 0
+
+    def add_rows(rows):
+        nonlocal added
+        for row in rows:
+            # rows this worker inserted itself are already in the index
+            if _is_indexed(row):
+                continue
+            if add_row(row):
+                added += 1
+                if response_cache is not None and index.loaded:
+                    # New content from another worker, cached answers for it are stale
+                    response_cache.invalidate(row['student_year'], row['student_room'], row['teacher_subject'])
+
+    pending = sorted(gaps)
+    for start in range(0, len(pending), INDEX_SYNC_GAP_BATCH):
+        try:
+            late = _fetch_rows_by_id(table, columns, pending[start:start + INDEX_SYNC_GAP_BATCH])
+        except Exception as e:
+            # a failed gap lookup must not stop new rows from being synced
+            metrics.log_event("index_gap_fetch_error", logging.WARNING, table=table, error=str(e))
+            break
+        gaps.difference_update(row['id'] for row in late)
+        add_rows(late)
+    while True:
+        rows = _fetch_rows_after(table, columns, _index_sync[mark], page_size)
+        previous = _index_sync[mark]
+        for row in rows:
+            gaps.update(range(max(previous + 1, row['id'] - INDEX_SYNC_LOOKBACK), row['id']))
+            previous = row['id']
+        add_rows(rows)
+        if rows:
+            # Rows with a broken embedding are skipped, not refetched forever
+            _index_sync[mark] = max(_index_sync[mark], rows[-1]['id'])
+        gaps.difference_update([gap for gap in gaps if gap <= _index_sync[mark] - INDEX_SYNC_LOOKBACK])
+        if len(rows) < page_size:
+            return added
+
+
+def sync_index(page_size=1000):
+    """
+    Pulls only the documents and passages with an id above their high-water
+    marks into the index, plus rows that committed late below it (see
+    INDEX_SYNC_LOOKBACK). The first call loads both tables. Returns the number
+    of rows added.
+
+    The documents table has no updated_at column, so edits to existing rows are
+    only picked up by reload_index().
+    """
+    with _index_load_lock, span("index_sync"):
+        added = _sync_table('documents', DOCUMENT_COLUMNS, "high_water_id", index_row, page_size)
+        if PASSAGE_CHUNKING:
+            try:
+                added += _sync_table('document_passages', PASSAGE_COLUMNS,
+                                     "passage_high_water_id", index_passage, page_size)
+            except Exception as e:
+                metrics.log_event("passage_sync_error", logging.WARNING, error=str(e),
+                                  hint="is database/document_passages.sql applied?")
+        index.loaded = True
+        _index_sync["last_sync"] = datetime.now()
+    return added
+
+
+def load_index(page_size=1000):
+    """
+    Builds the in-process vector index from the documents table if it isn't built yet.
+    """
+    if index.loaded:
+        return len(index)
+    sync_index(page_size)
+    metrics.log_event("index_loaded", rows=len(index))
+    return len(index)
+
+
+def reload_index():
+    """
+    Drops the in-process index and loads the documents table again from scratch.
+    """
+    with _index_load_lock:
+        index.clear()
+        if lexical_index is not None:
+            lexical_index.clear()
+        _document_passages.clear()
+        _index_sync["high_water_id"] = 0
+        _index_sync["passage_high_water_id"] = 0
+        for gaps in _index_sync_gaps.values():
+            gaps.clear()
+    return load_index()
+
+
+def _index_sync_loop(interval):
+    while True:
+        try:
+            if index.loaded:
+                added = sync_index()
+                if added:
+                    metrics.log_event("index_synced", added=added)
+            else:
+                load_index()
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(backend="supabase", kind="index_sync")
+            metrics.log_event("index_sync_error", logging.ERROR, error=str(e))
+        if _index_sync_stop.wait(interval):
+            return
+
+
+def start_index_sync(interval=INDEX_SYNC_INTERVAL):
+    """
+    Starts the background poller that keeps the index in step with documents
+    inserted by other workers. Disabled when interval is 0.
+    """
+    if not interval or RETRIEVAL_MODE == "database":
+        return None
+    thread = threading.Thread(target=_index_sync_loop, args=(interval,),
+                              name="index-sync", daemon=True)
+    thread.start()
+    return thread
+
+
+def index_status():
+    """
+    Row counts and staleness of the in-process vector index for /health.
+    """
+    last_sync = _index_sync["last_sync"]
+    return {
+        "loaded": index.loaded,
+        "rows": len(index),
+        "partitions": index.partition_count,
+        "lexical_rows": len(lexical_index) if lexical_index is not None else None,
+        "chunked_documents": len(_document_passages),
+        "high_water_id": _index_sync["high_water_id"],
+        "passage_high_water_id": _index_sync["passage_high_water_id"],
+        "last_sync": last_sync.isoformat() if last_sync else None,
+        "staleness_seconds": round((datetime.now() - last_sync).total_seconds(), 1) if last_sync else None
+    }
+
+
+# Progress of warm_up(), for /ready
+startup = {"started_at": None, "finished_at": None, "errors": {}}
+
+
+def warm_up():
+    """
+    Loads what the first requests need: the embedding model, the settings and,
+    in local retrieval mode, the vector index. The API runs it in a thread from
+    its lifespan hook so the port opens right away and /ready reports progress.
+    A failed step is retried lazily by the first request that needs it.
+    """
+    startup["started_at"] = datetime.now()
+    steps = [("embedding_model", embedder.load), ("settings", settings_cache.get)]
+    if RETRIEVAL_MODE == "local":
+        steps.append(("index", load_index))
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            startup["errors"][name] = f"{type(e).__name__}: {e}"
+            metrics.log_event("warm_up_error", logging.ERROR, step=name, error=str(e))
+    startup["finished_at"] = datetime.now()
+    metrics.log_event("warm_up_done", seconds=round((startup['finished_at'] - startup['started_at']).total_seconds(), 1))
+
 
+def readiness():
+    """
+    Whether this worker can answer queries without a cold start: the embedding
+    model is loaded, in local retrieval mode the vector index is built, and the
+    last background database check passed. LLM backends are reported but don't
+    take the worker out of rotation, every worker shares the same backends.
+    """
+    checks = {
+        "embedding_model": {"status": "ok" if embedder.loaded else "loading", "required": True,
+                            "model": embedder.model_name, "backend": embedder.backend},
+        "index": {"status": "ok" if RETRIEVAL_MODE == "database" or index.loaded else "loading",
+                  "required": RETRIEVAL_MODE == "local", "rows": len(index)},
+    }
+    checks.update(health_monitor.snapshot()["checks"])
+    started_at, finished_at = startup["started_at"], startup["finished_at"]
+    return {
+        "ready": all(check["status"] == "ok" for check in checks.values() if check["required"]),
+        "checks": checks,
+        "warm_up_seconds": round((finished_at - started_at).total_seconds(), 2) if finished_at else None,
+        "errors": startup["errors"],
+    }
+
+
+async def search_database(query_embedding, k, roomId, yearId, subjectId):
+    """
+    Ranks documents inside Postgres with the match_documents pgvector function.
+    Returns the same (similarity, row, vector) triples as VectorIndex.search,
+    without vectors.
+    """
+    client = await get_async_supabase()
+    response = await client.rpc('match_documents', {
+        "query_embedding": np.asarray(query_embedding, dtype=np.float32).tolist(),
+        "match_count": k,
+        "filter_year": yearId,
+        "filter_room": roomId,
+        "filter_subject": subjectId
+    }).execute()
+    rows = response.data if hasattr(response, 'data') else response["data"]
+    return [(row.pop('similarity'), row, None) for row in rows]
+
+
+def hybrid_search(query, query_embedding, k, roomId, yearId, subjectId):
+    """
+    Fuses the top HYBRID_CANDIDATES vector and BM25 hits by reciprocal rank and
+    keeps the best k. Returns (similarity, row, vector) triples like
+    VectorIndex.search in fused order. similarity stays the cosine similarity,
+    also for keyword-only hits: RRF scores only order the hits, they are too
+    compressed (about 1/61 vs 2/61) for context_builder's relative cut-off.
+    Rows that BM25 matched are copies with keyword_match=True, the context
+    builder keeps them whatever their cosine.
+    """
+    candidates = max(k, HYBRID_CANDIDATES)
+    vector_hits = index.search(query_embedding, candidates, year=yearId, room=roomId,
+                               subject=subjectId, with_vectors=True)
+    lexical_hits = lexical_index.search(query, candidates, year=yearId, room=roomId, subject=subjectId)
+
+    vector_keys = [_index_key(row) for _, row, _ in vector_hits]
+    lexical_keys = [key for _, key, _ in lexical_hits]
+    entries = {key: (row, vector) for key, (_, row, vector) in zip(vector_keys, vector_hits)}
+    for _, key, row in lexical_hits:
+        if key not in entries:
+            # the vector is still needed for near-duplicate removal in the context
+            entries[key] = (row, index.get(key, row))
+
+    fused = reciprocal_rank_fusion([vector_keys, lexical_keys], HYBRID_RRF_K)
+    query_vector = normalize(query_embedding).reshape(-1)
+    results = []
+    matched = set(lexical_keys)
+    for key, _ in fused[:k]:
+        row, vector = entries[key]
+        if key in matched:
+            row = dict(row, keyword_match=True)
+        similarity = float(vector @ query_vector) if vector is not None else 0.0
+        results.append((similarity, row, vector))
+    return results
+
+
+def group_passages(hits, k):
+    """
+    Groups passage hits by their document and keeps the best k documents. Each
+    document's content becomes its best PASSAGE_HITS_PER_DOCUMENT passages plus
+    their direct neighbours, merged without the repeated overlap.
+    """
+    documents = {}
+    for similarity, row, vector in hits:
+        doc_id = row.get('document_id', row['id'])
+        if doc_id not in documents:
+            if len(documents) == k:
+                continue
+            documents[doc_id] = [similarity, row, vector, set()]
+        elif row.get('keyword_match') and not documents[doc_id][1].get('keyword_match'):
+            documents[doc_id][1] = dict(documents[doc_id][1], keyword_match=True)
+        if 'passage_index' in row and len(documents[doc_id][3]) < PASSAGE_HITS_PER_DOCUMENT:
+            documents[doc_id][3].add(row['passage_index'])
+
+    results = []
+    for doc_id, (similarity, row, vector, matched) in documents.items():
+        # a copy: reload_index can clear the passage maps while we group, the
+        # passage hit is then kept as it is
+        passages = dict(_document_passages.get(doc_id, {})) if matched else {}
+        wanted = sorted({i + offset for i in matched for offset in (-1, 0, 1)} & passages.keys())
+        if wanted:
+            runs, run = [], [wanted[0]]
+            for i in wanted[1:]:
+                if i == run[-1] + 1:
+                    run.append(i)
+                else:
+                    runs.append(run)
+                    run = [i]
+            runs.append(run)
+            content = " … ".join(merge_passages([passages[i] for i in r]) for r in runs)
+            row = dict(row, content=content)
+        results.append((similarity, row, vector))
+    return results
+
+
+def _local_search(query_embedding, k, roomId, yearId, subjectId, query):
+    """Searches the in-memory index, returns (similarity, row, vector) grouped per document."""
+    # Several passages of one document can rank high, fetch extra and group them
+    fetch = k * 3 if _document_passages else k
+    while True:
+        if lexical_index is not None and query:
+            with span("hybrid_search"):
+                passage_hits = hybrid_search(query, query_embedding, fetch, roomId, yearId, subjectId)
+        else:
+            with span("vector_search"):
+                passage_hits = index.search(query_embedding, fetch, year=yearId,
+                                            room=roomId, subject=subjectId, with_vectors=True)
+        hits = group_passages(passage_hits, k)
+        if len(hits) >= k or len(passage_hits) < fetch:
+            return hits
+        fetch *= 4
+
+
+async def search_documents(query_embedding, k, roomId, yearId, subjectId, query=None):
+    """
+    Ranks documents against an already computed query embedding.
+    Returns (similarity, content, created_at, time_of_record, teacher_name,
+    teacher_subject, student_year, student_room, vector, keyword_match)
+    tuples, best first. vector is the normalized document embedding, None in
+    database mode. With RETRIEVAL_HYBRID the query text is also matched with
+    BM25 and keyword_match tells which documents it found.
+    """
     if k is None:
         k = 5
 
-    embedder = SentenceTransformer('all-MiniLM-L6-v2')
-    query_embedding = np.array(embedder.encode(query)).reshape(1, -1)
-
-    # Build Supabase filter
-    filters = {}
-    if roomId is not None:
-        filters['student_room'] = roomId
-    if yearId is not None:
-        filters['student_year'] = yearId
-    if subjectId is not None:
-        filters['teacher_subject'] = subjectId
-
-    # Query Supabase
-    query_builder = supabase.table('documents').select(
-        "content, embedding, created_at, time_of_record, teacher_name, teacher_subject, student_year, student_room")
-    for key, value in filters.items():
-        query_builder = query_builder.eq(key, value)
-    response = query_builder.execute()
-    rows = response.data if hasattr(response, 'data') else response["data"]
+    if RETRIEVAL_MODE == "database":
+        with span("database_search"):
+            hits = await search_database(query_embedding, k, roomId, yearId, subjectId)
+    else:
+        if not index.loaded:
+            with span("index_load"):
+                await asyncio.to_thread(load_index)
+        # ranking (and BM25 in pure Python) takes tens of ms on a big index, keep it off the event loop
+        hits = await asyncio.to_thread(_local_search, query_embedding, k, roomId, yearId, subjectId, query)
 
     results = []
-    for row in rows:
-        content = row['content']
-        embedding_str = row['embedding']
-        created_at = row['created_at']
-        time_of_record = row['time_of_record']
-        teacher_name = row['teacher_name']
-        teacher_subject = row['teacher_subject']
-        student_year = row['student_year']
-        student_room = row['student_room']
-        try:
-            doc_embedding = np.array(json.loads(embedding_str)).reshape(1, -1)
-            similarity = cosine_similarity(
-                query_embedding, doc_embedding)[0][0]
-            results.append((
-                similarity,
-                content,
-                created_at,
-                time_of_record,
-                teacher_name,
-                teacher_subject,
-                student_year,
-                student_room
-            ))
-        except Exception as e:
-            print(f"Error parsing embedding: {e}")
+    for similarity, row, vector in hits:
+        results.append((
+            similarity,
+            row['content'],
+            row['created_at'],
+            row['time_of_record'],
+            row['teacher_name'],
+            row['teacher_subject'],
+            row['student_year'],
+            row['student_room'],
+            vector,
+            row.get('keyword_match', False)
+        ))
+    return results
+
+
+async def check_and_embed(query):
+    """
+    Runs the system check and the query embedding concurrently, they don't
+    depend on each other.
+    """
+    def timed_check():
+        with span("check_system"):
+            return check_system()
 
-    results.sort(key=lambda x: x[0], reverse=True)
-    return results[:k]
+    async def timed_embed():
+        with span("embed_query"):
+            return await embedder.encode_async(query)
 
+    return await asyncio.gather(asyncio.to_thread(timed_check), timed_embed())
 
-def gen_response(query, k, roomId, yearId, subjectId):
-    system_status = check_system()
+
+async def qeury_database(query, k, roomId, yearId, subjectId):
+    system_status, query_embedding = await check_and_embed(query)
     if system_status is not True:
-        return {"role": "ai", "content": system_status}
+        return system_status
 
-    retrived_docs = qeury_database(query, k, roomId, yearId, subjectId)
-    if isinstance(retrived_docs, str):
-        return {"role": "ai", "content": retrived_docs}
+    return await search_documents(query_embedding, k, roomId, yearId, subjectId, query)
 
-    if not retrived_docs:
-        return {"role": "ai", "content": "ไม่พบข้อมูลที่เกี่ยวข้อง"}
 
-    context = "\n\n".join(
-        [f"Content: {doc[1]}\nผู้สอน: {doc[4]} ({doc[5]})\nเวลาที่สอน/บันทึก: {doc[2]} {doc[3]}" for doc in retrived_docs]
-    )
+async def cached_answer(llm, query_embedding, roomId, yearId, subjectId):
+    # the sqlite backend blocks on disk, every backend is called from a thread
+    with span("cache_lookup"):
+        return await asyncio.to_thread(_cached_answer, llm, query_embedding, roomId, yearId, subjectId)
+
 
-    prompt_to_ai = f"""
+def _cached_answer(llm, query_embedding, roomId, yearId, subjectId):
+    if response_cache is None:
+        return None
+    return response_cache.get(ResponseCache.scope(llm, yearId, roomId, subjectId), query_embedding)
+
+
+async def cache_answer(llm, query_embedding, roomId, yearId, subjectId, content):
+    if response_cache is not None and content:
+        await asyncio.to_thread(response_cache.put, ResponseCache.scope(llm, yearId, roomId, subjectId),
+                                query_embedding, content)
+
+
+def build_context(retrived_docs, llm, count=True):
+    """
+    Turns retrieved docs into prompt context within the llm's token budget,
+    dropping near-duplicate and low-score tail documents. count=False leaves
+    context_totals alone (a second context for the same request).
+    """
+    with span("context_build"):
+        context, stats = context_builder.build_context(
+            retrived_docs,
+            CONTEXT_TOKEN_BUDGET[llm],
+            vectors=[doc[8] for doc in retrived_docs],
+            keyword_matches=[doc[9] for doc in retrived_docs],
+            dedupe_threshold=CONTEXT_DEDUPE_THRESHOLD,
+            min_score_ratio=CONTEXT_MIN_SCORE_RATIO,
+        )
+    if count:
+        with _context_totals_lock:
+            for key in context_totals:
+                context_totals[key] += stats[key]
+    metrics.log_event("context", llm=llm, **stats)
+    return context
+
+
+async def ollama_fallback_prompt(retrived_docs, query):
+    """
+    The Ollama prompt for a Gemini request that fails over, sized for the
+    local model's budget. Built off the event loop and only when needed.
+    """
+    return ollama_prompt(await asyncio.to_thread(build_context, retrived_docs, "ollama", False), query)
+
+
+def context_metadata(retrived_docs):
+    """Describes the retrieved documents (without their content) for streaming clients."""
+    return [
+        {
+            "similarity": round(float(doc[0]), 4),
+            "created_at": doc[2],
+            "time_of_record": doc[3],
+            "teacher_name": doc[4],
+            "teacher_subject": doc[5],
+            "student_year": doc[6],
+            "student_room": doc[7]
+        }
+        for doc in retrived_docs
+    ]
+
+
+def ollama_prompt(context, query):
+    return f"""
 You are a friendly learning assistant that helps students understand academic content.
 
 - Only use the information provided in the context below. If the information is not found, reply with: "ไม่พบข้อมูลที่เกี่ยวข้อง".
@@ -131,39 +742,9 @@ Question from student:
 {query}
 """
 
-    response = ollama.chat(
-        #  model="gemma:7b",
-        #  model="phi4-mini",
-        model="Mistral",
-        messages=[
-            {"role": "system", "content": "You are a helpful student assistant trained to explain academic content from class context only."},
-            {"role": "user", "content": prompt_to_ai}
-        ]
-    )
-
-    print("AI prompt_to_ai:", prompt_to_ai)
-    return response['message']['content']
-
 
-def gen_gemini(query, k, roomId, yearId, subjectId):
-    system_status = check_system()
-    if system_status is not True:
-        return {"role": "ai", "content": system_status}
-
-    retrived_docs = qeury_database(query, k, roomId, yearId, subjectId)
-    if isinstance(retrived_docs, str):
-        return {"role": "ai", "content": retrived_docs}
-
-    api_key = os.getenv("APIKEYS")
-
-    if not retrived_docs:
-        return {"role": "ai", "content": "ไม่พบข้อมูลที่เกี่ยวข้อง"}
-
-    context = "\n\n".join(
-        [f"Content: {doc[1]}\nผู้สอน: {doc[4]} ({doc[5]})\nเวลาที่สอน/บันทึก: {doc[2]} {doc[3]}" for doc in retrived_docs]
-    )
-
-    prompt_to_ai = f"""
+def gemini_prompt(context, query):
+    return f"""
 You are a friendly learning assistant name 'Toth' that helps students understand academic content.
 
 - Only use the information provided in the context below. If the information is not found, reply with: "ไม่พบข้อมูลที่เกี่ยวข้อง".
@@ -181,46 +762,161 @@ Question and chat history from student:
 {query}
 """
 
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-    headers = {
-        "Content-Type": "application/json",
-        "X-goog-api-key": api_key
-    }
-    data = {
-        "contents": [
-            {
-                "parts": [
-                    {"text": prompt_to_ai}
-                ]
-            }
-        ]
-    }
 
-    response = requests.post(url, headers=headers, json=data)
+async def gen_response(query, k, roomId, yearId, subjectId):
+    system_status, query_embedding = await check_and_embed(query)
+    if system_status is not True:
+        return {"role": "ai", "content": system_status}
+
+    cached = await cached_answer("ollama", query_embedding, roomId, yearId, subjectId)
+    if cached is not None:
+        return cached
+
+    retrived_docs = await search_documents(query_embedding, k, roomId, yearId, subjectId, query)
+
+    if not retrived_docs:
+        return {"role": "ai", "content": "ไม่พบข้อมูลที่เกี่ยวข้อง"}
+
+    prompt_to_ai = ollama_prompt(await asyncio.to_thread(build_context, retrived_docs, "ollama"), query)
+
+    try:
+        with span("llm_ollama"):
+            content = await ollama_llm.generate(prompt_to_ai, group=(yearId, roomId))
+    except SchedulerBusy:
+        return {"role": "ai", "content": BUSY_MESSAGE}
+    except LLMError as e:
+        metrics.log_event("llm_error", logging.ERROR, backend="ollama", error=str(e))
+        return {"role": "ai", "content": "เกิดข้อผิดพลาดในการเรียกใช้โมเดล"}
+
+    await cache_answer("ollama", query_embedding, roomId, yearId, subjectId, content)
+    return content
+
+
+async def gen_gemini(query, k, roomId, yearId, subjectId):
+    system_status, query_embedding = await check_and_embed(query)
+    if system_status is not True:
+        return {"role": "ai", "content": system_status}
+
+    cached = await cached_answer("gemini", query_embedding, roomId, yearId, subjectId)
+    if cached is not None:
+        return {"role": "ai", "content": cached}
 
-    if response.status_code != 200:
-        print("Error:", response.status_code, response.text)
-        return {"role": "ai", "content": "เกิดข้อผิดพลาดในการเรียกใช้ Gemini API"}
+    retrived_docs = await search_documents(query_embedding, k, roomId, yearId, subjectId, query)
+
+    if not retrived_docs:
+        return {"role": "ai", "content": "ไม่พบข้อมูลที่เกี่ยวข้อง"}
+
+    prompt_to_ai = gemini_prompt(await asyncio.to_thread(build_context, retrived_docs, "gemini"), query)
+    fallback_prompt = lambda: ollama_fallback_prompt(retrived_docs, query)
 
     try:
-        result = response.json()
-        content = result["candidates"][0]["content"]["parts"][0]["text"]
-        return {"role": "ai", "content": content}
-    except Exception as e:
-        print("Parse Error:", e)
-        return {"role": "ai", "content": "ไม่สามารถประมวลผลคำตอบได้"}
+        with span("llm_gemini"):
+            content, backend = await gemini_failover.generate(
+                prompt_to_ai, group=(yearId, roomId), fallback_prompt=fallback_prompt)
+    except SchedulerBusy:
+        return {"role": "ai", "content": BUSY_MESSAGE}
+    except LLMError as e:
+        metrics.log_event("llm_error", logging.ERROR, backend="gemini", error=str(e))
+        return {"role": "ai", "content": GEMINI_ERROR_MESSAGE}
 
+    # fallback answers aren't cached so Gemini answers again once it's back
+    if backend == "gemini":
+        await cache_answer("gemini", query_embedding, roomId, yearId, subjectId, content)
+    return {"role": "ai", "content": content}
 
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
 
+# streaming (server-sent events)
 
-def add_document(doc_data):
-    system_status = check_system()
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_context(llm, query, k, roomId, yearId, subjectId):
+    """
+    Shared first half of the streaming endpoints. Returns (docs, query_embedding, None)
+    or (None, None, closing SSE events) when there is nothing to send to the model.
+    """
+    system_status, query_embedding = await check_and_embed(query)
     if system_status is not True:
-        return system_status
+        return None, None, [sse_event("error", system_status), sse_event("done", {})]
+
+    cached = await cached_answer(llm, query_embedding, roomId, yearId, subjectId)
+    if cached is not None:
+        return None, None, [sse_event("token", {"content": cached, "cached": True}), sse_event("done", {})]
+
+    retrived_docs = await search_documents(query_embedding, k, roomId, yearId, subjectId, query)
+    if not retrived_docs:
+        return None, None, [sse_event("token", {"content": "ไม่พบข้อมูลที่เกี่ยวข้อง"}), sse_event("done", {})]
+    return retrived_docs, query_embedding, None
 
-    from datetime import datetime, time
 
+async def stream_response(query, k, roomId, yearId, subjectId):
+    """
+    Streaming version of gen_response. Yields SSE events: 'context' with the
+    retrieved document metadata, then 'token' chunks from Ollama, then 'done'.
+    """
+    retrived_docs, query_embedding, events = await _stream_context("ollama", query, k, roomId, yearId, subjectId)
+    if events:
+        for event in events:
+            yield event
+        return
+
+    yield sse_event("context", context_metadata(retrived_docs))
+    prompt_to_ai = ollama_prompt(await asyncio.to_thread(build_context, retrived_docs, "ollama"), query)
+    answer = []
+    try:
+        with span("llm_stream_ollama"):
+            async for content in ollama_llm.stream(prompt_to_ai, group=(yearId, roomId)):
+                answer.append(content)
+                yield sse_event("token", {"content": content})
+        await cache_answer("ollama", query_embedding, roomId, yearId, subjectId, "".join(answer))
+    except SchedulerBusy:
+        yield sse_event("error", BUSY_MESSAGE)
+    except LLMError as e:
+        metrics.log_event("llm_stream_error", logging.ERROR, backend="ollama", error=str(e))
+        yield sse_event("error", {"error": "exception", "details": "เกิดข้อผิดพลาดในการเรียกใช้โมเดล"})
+    yield sse_event("done", {})
+
+
+async def stream_gemini(query, k, roomId, yearId, subjectId):
+    """
+    Streaming version of gen_gemini using streamGenerateContent. Yields the same
+    SSE events as stream_response.
+    """
+    retrived_docs, query_embedding, events = await _stream_context("gemini", query, k, roomId, yearId, subjectId)
+    if events:
+        for event in events:
+            yield event
+        return
+
+    yield sse_event("context", context_metadata(retrived_docs))
+    prompt_to_ai = gemini_prompt(await asyncio.to_thread(build_context, retrived_docs, "gemini"), query)
+    fallback_prompt = lambda: ollama_fallback_prompt(retrived_docs, query)
+    answer = []
+    backend = None
+    try:
+        with span("llm_stream_gemini"):
+            async for backend, text in gemini_failover.stream(prompt_to_ai, group=(yearId, roomId),
+                                                              fallback_prompt=fallback_prompt):
+                answer.append(text)
+                yield sse_event("token", {"content": text})
+        if backend == "gemini":
+            await cache_answer("gemini", query_embedding, roomId, yearId, subjectId, "".join(answer))
+    except SchedulerBusy:
+        yield sse_event("error", BUSY_MESSAGE)
+    except LLMError as e:
+        metrics.log_event("llm_stream_error", logging.ERROR, backend="gemini", error=str(e))
+        yield sse_event("error", {"error": "gemini", "details": GEMINI_ERROR_MESSAGE})
+    yield sse_event("done", {})
+
+
+def prepare_document(doc_data):
+    """
+    Parses one lesson record. Returns (context_text, insert_data) where
+    context_text is the text to embed and insert_data the documents row
+    without its embedding.
+    """
     # Parse string datetime to datetime object
     if isinstance(doc_data['time_summit'], str):
         time_summit = datetime.fromisoformat(
@@ -243,13 +939,8 @@ def add_document(doc_data):
         f"ชั้นปี: ปี {doc_data['student_year']}, ห้อง {doc_data['student_room']}"
     )
 
-    embedding = embedder.encode(context_text).tolist()
-    embedding_json = json.dumps(embedding)
-
-    # Insert into Supabase
     insert_data = {
         "content": doc_data["content"],
-        "embedding": embedding_json,
         "created_at": time_summit.date().isoformat(),
         "time_of_record": time_of_record.strftime('%H:%M:%S'),
         "teacher_name": doc_data["teacher_name"],
@@ -257,20 +948,209 @@ def add_document(doc_data):
         "student_year": doc_data["student_year"],
         "student_room": doc_data["student_room"]
     }
-    response = supabase.table('documents').insert(insert_data).execute()
+    return context_text, insert_data
+
+
+def set_embedding(insert_data, vector):
+    insert_data["embedding"] = encode_embedding(vector, EMBEDDING_STORAGE_FORMAT)
+    if PGVECTOR_WRITE:
+        insert_data["embedding_vec"] = vector.tolist()
+    return insert_data
+
+
+def passage_text(row, passage):
+    return (
+        f"เนื้อหา: {passage}\n"
+        f"อาจารย์: {row['teacher_name']} ({row['teacher_subject']})\n"
+        f"วันที่สอน: {str(row['created_at'])[:10]}\n"
+        f"ชั้นปี: ปี {row['student_year']}, ห้อง {row['student_room']}"
+    )
+
+
+async def store_passages(rows):
+    """
+    Splits the long documents among freshly inserted rows into passages,
+    embeds them in one batch and stores them in document_passages.
+    Returns the number of passages stored.
+    """
+    if not PASSAGE_CHUNKING:
+        return 0
+    passage_rows = []
+    for row in rows or []:
+        chunks = chunk_text(row['content'], PASSAGE_MAX_CHARS, PASSAGE_OVERLAP_CHARS)
+        if len(chunks) < 2:
+            continue
+        for passage_index, (passage, overlap) in enumerate(chunks):
+            passage_rows.append({
+                "document_id": row['id'],
+                "passage_index": passage_index,
+                "overlap": overlap,
+                "content": passage,
+                "created_at": row['created_at'],
+                "time_of_record": row['time_of_record'],
+                "teacher_name": row['teacher_name'],
+                "teacher_subject": row['teacher_subject'],
+                "student_year": row['student_year'],
+                "student_room": row['student_room']
+            })
+    if not passage_rows:
+        return 0
+
+    texts = [passage_text(p, p['content']) for p in passage_rows]
+    vectors = await asyncio.to_thread(embedder.encode_batch, texts)
+    for passage, vector in zip(passage_rows, vectors):
+        passage["embedding"] = encode_embedding(vector, EMBEDDING_STORAGE_FORMAT)
+    try:
+        client = await get_async_supabase()
+        response = await client.table('document_passages').insert(passage_rows).execute()
+    except Exception as e:
+        # The whole document stays searchable, only the passages are missing
+        metrics.log_event("passage_store_error", logging.ERROR, passages=len(passage_rows), error=str(e))
+        return 0
+    if index.loaded:
+        for passage in response.data:
+            index_passage(passage)
+    return len(response.data)
+
+
+async def backfill_passages(page_size=200):
+    """
+    Splits existing long documents that have no passages yet.
+    Returns the number of passages stored.
+    """
+    client = await get_async_supabase()
+    chunked = set()
+    last_id = 0
+    while True:
+        response = await client.table('document_passages').select('id, document_id').gt(
+            'id', last_id).order('id').limit(1000).execute()
+        chunked.update(row['document_id'] for row in response.data)
+        if len(response.data) < 1000:
+            break
+        last_id = response.data[-1]['id']
+
+    stored = 0
+    last_id = 0
+    while True:
+        response = await client.table('documents').select(
+            "id, content, created_at, time_of_record, teacher_name, teacher_subject, student_year, student_room").gt(
+            'id', last_id).order('id').limit(page_size).execute()
+        rows = response.data
+        stored += await store_passages([row for row in rows if row['id'] not in chunked])
+        if len(rows) < page_size:
+            return stored
+        last_id = rows[-1]['id']
+
+
+def documents_inserted(rows):
+    """
+    Makes freshly inserted rows searchable in this worker and drops the cached
+    answers they make stale. The high-water mark is left to the poller so rows
+    committed out of id order by other workers are not skipped.
+    """
+    scopes = set()
+    for row in rows or []:
+        scopes.add((row["student_year"], row["student_room"], row["teacher_subject"]))
+        if index.loaded:
+            index_row(row)
+    if response_cache is not None:
+        for year, room, subject in scopes:
+            response_cache.invalidate(year, room, subject)
+
+
+async def add_document(doc_data):
+    system_status = await asyncio.to_thread(check_system)
+    if system_status is not True:
+        return system_status
+
+    context_text, insert_data = prepare_document(doc_data)
+    with span("embed_document"):
+        set_embedding(insert_data, await embedder.encode_async(context_text))
+
+    # Insert into Supabase
+    client = await get_async_supabase()
+    try:
+        with span("supabase_insert"):
+            response = await client.table('documents').insert(insert_data).execute()
+    except Exception:
+        UPSTREAM_ERRORS.inc(backend="supabase", kind="insert")
+        raise
     if hasattr(response, 'error') and response.error:
         return f"Error adding document: {response.error}"
+
+    inserted = response.data if hasattr(response, 'data') else response.get('data', [])
+    with span("index_insert"):
+        await asyncio.to_thread(documents_inserted, inserted)
+    with span("store_passages"):
+        await store_passages(inserted)
     return "Document added successfully"
 
+
+async def add_documents(docs, chunk_size=500):
+    """
+    Bulk version of add_document. Embeds every document in CPU batches and
+    inserts them with one multi-row insert per chunk. A failed chunk is retried
+    row by row so the bad rows can be reported.
+    Returns {"inserted": n, "failed": n, "results": [per item status]}.
+    """
+    system_status = await asyncio.to_thread(check_system)
+    if system_status is not True:
+        return system_status
+
+    results = [None] * len(docs)
+    prepared = []
+    for i, doc_data in enumerate(docs):
+        try:
+            prepared.append((i,) + prepare_document(doc_data))
+        except Exception as e:
+            results[i] = {"index": i, "status": "error", "error": f"invalid document: {e}"}
+
+    vectors = await asyncio.to_thread(embedder.encode_batch, [text for _, text, _ in prepared])
+    for (_, _, insert_data), vector in zip(prepared, vectors):
+        set_embedding(insert_data, vector)
+
+    client = await get_async_supabase()
+    for start in range(0, len(prepared), chunk_size):
+        chunk = prepared[start:start + chunk_size]
+        try:
+            response = await client.table('documents').insert([row for _, _, row in chunk]).execute()
+        except Exception as e:
+            metrics.log_event("bulk_insert_error", logging.WARNING, rows=len(chunk), error=str(e))
+            inserted = []
+            for i, _, row in chunk:
+                try:
+                    response = await client.table('documents').insert(row).execute()
+                except Exception as row_error:
+                    results[i] = {"index": i, "status": "error", "error": str(row_error)}
+                    continue
+                if not response.data:
+                    results[i] = {"index": i, "status": "error", "error": "no row returned"}
+                    continue
+                results[i] = {"index": i, "status": "ok", "id": response.data[0].get("id")}
+                inserted.extend(response.data)
+        else:
+            inserted = response.data
+            for (i, _, _), row in zip(chunk, inserted):
+                results[i] = {"index": i, "status": "ok", "id": row.get("id")}
+            # PostgREST may return fewer rows than were sent
+            for i, _, _ in chunk[len(inserted):]:
+                results[i] = {"index": i, "status": "error", "error": "no row returned"}
+        await asyncio.to_thread(documents_inserted, inserted)
+        await store_passages(inserted)
+
+    inserted_count = sum(1 for r in results if r["status"] == "ok")
+    return {"inserted": inserted_count, "failed": len(results) - inserted_count, "results": results}
+
 # quizz-gemini
 
 
-def gen_quizz_gemini(k, roomId, yearId, subjectId):
+async def gen_quizz_gemini(k, roomId, yearId, subjectId, before_call=None):
     """
     Generates quiz questions based on content in the database for a specific room, year, and subject.
     Returns quiz questions in a standardized JSON format.
+    before_call (a coroutine function) is awaited before each LLM attempt, quiz jobs rate limit with it.
     """
-    system_status = check_system()
+    system_status = await asyncio.to_thread(check_system)
     if system_status is not True:
         return {"error": True, "message": system_status}
 
@@ -306,7 +1186,8 @@ def gen_quizz_gemini(k, roomId, yearId, subjectId):
             filters['teacher_subject'] = subjectId
 
         # Query Supabase with random ordering to get random documents
-        query_builder = supabase.table('documents').select(
+        client = await get_async_supabase()
+        query_builder = client.table('documents').select(
             "content, teacher_subject").order('created_at', desc=False)
 
         for key, value in filters.items():
@@ -314,7 +1195,7 @@ def gen_quizz_gemini(k, roomId, yearId, subjectId):
 
         # Limit by k
         query_builder = query_builder.limit(k)
-        response = query_builder.execute()
+        response = await query_builder.execute()
         rows = response.data if hasattr(
             response, 'data') else response.get('data', [])
 
@@ -354,93 +1235,160 @@ def gen_quizz_gemini(k, roomId, yearId, subjectId):
 {context}
 """
 
-        # Call Gemini API
-        api_key = os.getenv("APIKEYS")
-        if not api_key:
-            return {"error": True, "message": "API key not found"}
+        # Call Gemini API (the local model when Gemini is down)
+        problems = []
+        for attempt in range(QUIZ_MAX_ATTEMPTS):
+            if before_call is not None:
+                await before_call()
+            try:
+                content, _ = await gemini_failover.generate(prompt_to_ai, json_output=True, group=(yearId, roomId))
+            except (LLMError, SchedulerBusy) as e:
+                metrics.log_event("llm_error", logging.ERROR, backend="gemini", purpose="quiz", error=repr(e))
+                return {"error": True, "message": GEMINI_ERROR_MESSAGE}
+
+            # Clean up, parse and check the quiz against the schema
+            try:
+                quiz_data = repair_quiz_json(content)
+                problems = validate_quiz(quiz_data)
+            except ValueError as e:
+                problems = [str(e)]
+            if not problems:
+                return {"error": False, "data": quiz_data}
+            metrics.log_event("quiz_invalid", logging.WARNING, attempt=attempt + 1, problems=problems,
+                              length=len(content))
+
+        return {"error": True, "message": "ไม่สามารถแปลงคำตอบเป็น JSON ได้"}
 
-        url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-        headers = {
-            "Content-Type": "application/json",
-            "X-goog-api-key": api_key
-        }
-        data = {
-            "contents": [
-                {
-                    "parts": [
-                        {"text": prompt_to_ai}
-                    ]
-                }
-            ]
-        }
-
-        response = requests.post(url, headers=headers, json=data)
+    except Exception as e:
+        metrics.log_event("quiz_error", logging.ERROR, error=str(e))
+        return {"error": True, "message": f"เกิดข้อผิดพลาด: {str(e)}"}
 
-        if response.status_code != 200:
-            print("Error:", response.status_code, response.text)
-            return {"error": True, "message": "เกิดข้อผิดพลาดในการเรียกใช้ Gemini API"}
 
-        result = response.json()
-        content = result["candidates"][0]["content"]["parts"][0]["text"]
+async def store_quiz(scope, questions):
+    """Saves a finished quiz in the quizzes table and returns its id."""
+    client = await get_async_supabase()
+    response = await client.table('quizzes').insert({
+        "student_year": scope.get("year_id"),
+        "student_room": scope.get("room_id"),
+        "teacher_subject": scope.get("subject_id"),
+        "questions": questions
+    }).execute()
+    return response.data[0]["id"]
 
-        # Clean up and parse JSON from Gemini response
-        try:
-            # Remove markdown code blocks if present
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-
-            # Parse JSON
-            quiz_data = json.loads(content)
-            return {"error": False, "data": quiz_data}
-        except Exception as e:
-            print(f"JSON parsing error: {e}")
-            print(f"Raw content: {content}")
-            return {"error": True, "message": "ไม่สามารถแปลงคำตอบเป็น JSON ได้"}
 
-    except Exception as e:
-        print(f"Quiz generation error: {e}")
-        return {"error": True, "message": f"เกิดข้อผิดพลาด: {str(e)}"}
+async def latest_quiz(roomId, yearId, subjectId):
+    """
+    Returns the most recent precomputed quiz for a class, or an error dict
+    when none has been generated yet.
+    """
+    client = await get_async_supabase()
+    query_builder = client.table('quizzes').select(
+        "id, created_at, student_year, student_room, teacher_subject, questions")
+    for key, value in (('student_room', roomId), ('student_year', yearId), ('teacher_subject', subjectId)):
+        query_builder = query_builder.is_(key, "null") if value is None else query_builder.eq(key, value)
+    response = await query_builder.order('created_at', desc=True).limit(1).execute()
+    if not response.data:
+        return {"error": True, "message": "ยังไม่มีควิซสำหรับห้องเรียนนี้"}
+    return {"error": False, "data": response.data[0]}
+
+
+async def save_quiz_job(job):
+    """Writes a quiz job's status to the quiz_jobs table (database/quizzes.sql)."""
+    client = await get_async_supabase()
+    await client.table('quiz_jobs').upsert({
+        "id": job["id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "finished_at": job["finished_at"],
+        "scopes": job["scopes"]
+    }).execute()
+
+
+async def load_quiz_job(job_id):
+    """Reads a quiz job started by another worker, None when there is no such job."""
+    client = await get_async_supabase()
+    response = await client.table('quiz_jobs').select(
+        "id, status, created_at, finished_at, scopes").eq('id', job_id).limit(1).execute()
+    return response.data[0] if response.data else None
+
+
+quiz_jobs = QuizJobManager(
+    gen_quizz_gemini,
+    store_quiz,
+    concurrency=int(os.getenv("QUIZ_CONCURRENCY", "4")),
+    rate_per_minute=float(os.getenv("QUIZ_RATE_PER_MINUTE", "30")),
+    save=save_quiz_job,
+    load=load_quiz_job,
+)
 
 # check supabase db
 
 
-def check_database_status():
+# Dependency checks behind /ready and /health, refreshed in the background so
+# probes cost the same whatever the size of the documents table
+# estimated reads the planner statistics instead of a count(*) over the whole table
+HEALTH_COUNT_METHOD = os.getenv("HEALTH_COUNT_METHOD", "estimated")  # exact, planned or estimated
+health_monitor = HealthMonitor(
+    interval=float(os.getenv("HEALTH_CHECK_INTERVAL", "15")),
+    timeout=float(os.getenv("HEALTH_CHECK_TIMEOUT", "5")),
+)
+
+
+async def database_health():
+    # head=True: Postgres counts the rows and only the count is sent back
+    client = await get_async_supabase()
+    response = await client.table('documents').select('id', count=HEALTH_COUNT_METHOD, head=True).execute()
+    return {"documents": response.count}
+
+
+async def ollama_health():
+    if not await ollama_llm.ping():
+        raise LLMError(f"model {OLLAMA_MODEL} is not available on the Ollama server")
+    return {"model": OLLAMA_MODEL}
+
+
+async def gemini_health():
+    # No request is sent (it would use quota), the circuit breaker knows how the last calls went
+    if not gemini_llm.api_key:
+        raise LLMError("APIKEYS is not set")
+    if gemini_llm.breaker.state == "open":
+        raise CircuitOpen("circuit is open after repeated failures")
+    return {"circuit": gemini_llm.breaker.state}
+
+
+health_monitor.add("database", database_health)
+health_monitor.add("ollama", ollama_health, required=False)
+health_monitor.add("gemini", gemini_health, required=False)
+metrics.REGISTRY.callback("toth_dependency_up", "1 when the last background check of a dependency passed", "gauge",
+                          lambda: {(name,): int(result["status"] == "ok") for name, result in health_monitor.results.items()},
+                          ("check",))
+
+
+async def check_database_status():
     """
-    Checks the status of the Supabase database connection by attempting a simple select query.
+    Last result of the background database check (a row count, no rows are
+    fetched). Runs the check first if it never ran in this worker.
     Returns a dict with 'status' and 'details'.
     """
-    try:
-        # Try to fetch 1 row from documents table
-        response = supabase.table('documents').select('id').execute()
-        # If response has data, connection is OK
-        if hasattr(response, 'data'):
-            return {"status": "ok", "details": f"Connected. Rows in documents: {len(response.data)}"}
-        elif isinstance(response, dict) and 'data' in response:
-            return {"status": "ok", "details": f"Connected. Rows in documents: {len(response['data'])}"}
-        else:
-            return {"status": "error", "details": str(response)}
-    except Exception as e:
-        return {"status": "error", "details": str(e)}
+    result = health_monitor.results.get("database")
+    if result is None:
+        result = (await health_monitor.check_now("database"))["checks"]["database"]
+    if result["status"] == "ok":
+        return {"status": "ok", "details": f"Connected. Rows in documents: {result['documents']}",
+                "checked_at": result["checked_at"]}
+    return {"status": "error", "details": result["details"], "checked_at": result["checked_at"]}
 
 
 def school_data():
     try:
-        response = supabase.table('setting').select('status').eq('content', 'system').execute()
-        room = supabase.table('setting').select('status').eq('content', 'room_len').execute()
-        year = supabase.table('setting').select('status').eq('content', 'year_len').execute()
-        teacher = supabase.table('teacher').select('teacher_name').execute()
-
-        # Safely extract data from response
-        data = getattr(response, 'data', None) or response.get('data', [])
-        teacher_data = [t['teacher_name'] for t in teacher.data] if hasattr(teacher, 'data') else []
+        cached = settings_cache.get()
+        settings = cached["settings"]
 
         return {
-                "system_status": data[0]['status'] if data else "unknown",
-                "room_length": room.data[0]['status'] if hasattr(room, 'data') and room.data else "unknown",
-                "year_length": year.data[0]['status'] if hasattr(year, 'data') and year.data else "unknown",
-                "teacher": teacher_data
+                "system_status": settings.get('system', "unknown"),
+                "room_length": settings.get('room_len', "unknown"),
+                "year_length": settings.get('year_len', "unknown"),
+                "teacher": cached["teachers"]
         }
 
     except Exception as e:
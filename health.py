@@ -0,0 +1,75 @@
+import asyncio
+import time
+from datetime import datetime
+
+
+class HealthMonitor:
+    """
+    Runs the dependency checks (database, LLM backends) every interval seconds
+    in a background task and keeps their last result, so liveness and
+    readiness probes only read memory no matter how big the tables are.
+
+    A check is an async function returning a dict of details, or raising when
+    the dependency is unusable. Failing required checks make the worker not
+    ready; optional ones are only reported.
+    """
+
+    def __init__(self, interval=15.0, timeout=5.0):
+        self.interval = interval
+        self.timeout = timeout
+        self.checks = {}
+        self.results = {}
+        self._task = None
+
+    def add(self, name, check, required=True):
+        self.checks[name] = (check, required)
+
+    async def _run_check(self, name, check):
+        start = time.perf_counter()
+        try:
+            details = await asyncio.wait_for(check(), self.timeout)
+            result = {"status": "ok", **(details or {})}
+        except asyncio.TimeoutError:
+            result = {"status": "error", "details": f"no answer within {self.timeout}s"}
+        except Exception as e:
+            result = {"status": "error", "details": f"{type(e).__name__}: {e}"}
+        result["checked_at"] = datetime.now().isoformat(timespec="seconds")
+        result["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        self.results[name] = result
+        return result
+
+    async def check_now(self, *names):
+        """Runs the named checks (all when none are given) right away."""
+        names = names or tuple(self.checks)
+        await asyncio.gather(*(self._run_check(name, self.checks[name][0]) for name in names))
+        return self.snapshot()
+
+    async def _loop(self):
+        while True:
+            await self.check_now()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Starts the refresh task on the running event loop, the first round runs at once."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self):
+        """
+        Last result per check ({"status": "unknown"} before its first run)
+        and whether every required check passed.
+        """
+        checks = {name: dict(self.results.get(name, {"status": "unknown"}), required=required)
+                  for name, (_, required) in self.checks.items()}
+        ok = all(result["status"] == "ok" for result in checks.values() if result["required"])
+        return {"ok": ok, "checks": checks}
@@ -0,0 +1,61 @@
+"""
+Bulk loads lesson records into the documents table.
+
+run with
+python ingest_documents.py lessons.ndjson
+python ingest_documents.py lessons.json --chunk-size 200
+cat lessons.ndjson | python ingest_documents.py -
+python ingest_documents.py --backfill-passages
+
+Input is NDJSON (one record per line) or a JSON list, with the same fields as
+POST /add-document.
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from func import backfill_passages
+from toth_api import ingest_documents, parse_ndjson
+
+
+def read_items(path):
+    text = sys.stdin.read() if path == "-" else open(path, encoding="utf-8").read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return parse_ndjson(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", nargs="?", help="NDJSON or JSON file, - for stdin")
+    parser.add_argument("--chunk-size", type=int, default=500,
+                        help="rows per multi-row insert")
+    parser.add_argument("--backfill-passages", action="store_true",
+                        help="split existing long documents into passages instead of loading a file")
+    args = parser.parse_args()
+
+    if args.backfill_passages:
+        stored = asyncio.run(backfill_passages())
+        print(f"Stored {stored} passages")
+        return
+    if not args.path:
+        parser.error("path is required")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    items = read_items(args.path)
+    result = asyncio.run(ingest_documents(items, args.chunk_size))
+    if "results" not in result:
+        print(json.dumps(result, ensure_ascii=False))
+        sys.exit(1)
+
+    for item in result["results"]:
+        if item["status"] != "ok":
+            print(json.dumps(item, ensure_ascii=False, default=str))
+    print(f"Inserted {result['inserted']} of {len(items)} documents, {result['failed']} failed")
+    sys.exit(1 if result["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import math
+import re
+import threading
+from collections import Counter
+
+# pythainlp's word_tokenize, imported on first use (slow import), False when not installed
+_word_tokenize = None
+
+_WORD = re.compile(r"[a-z0-9]+|[฀-๿]+")
+_THAI = re.compile(r"[฀-๿]")
+
+
+def _bigrams(run):
+    if len(run) < 2:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def _word_segmenter():
+    global _word_tokenize
+    if _word_tokenize is None:
+        try:
+            from pythainlp.tokenize import word_tokenize
+        except ImportError:  # optional, real Thai word segmentation
+            word_tokenize = False
+        _word_tokenize = word_tokenize
+    return _word_tokenize
+
+
+def tokenize(text):
+    """
+    Lowercased search terms. Uses pythainlp word segmentation when installed,
+    otherwise latin/digit words plus overlapping character bigrams of Thai
+    runs (Thai is written without spaces between words).
+    """
+    text = text.lower()
+    word_tokenize = _word_segmenter()
+    if word_tokenize:
+        words = word_tokenize(text, engine="newmm", keep_whitespace=False)
+        return [w for w in (w.strip() for w in words) if w and _WORD.fullmatch(w)]
+    tokens = []
+    for word in _WORD.findall(text):
+        tokens.extend(_bigrams(word) if _THAI.match(word) else [word])
+    return tokens
+
+
+class _Partition:
+    """Term statistics of the documents in one (year, room, subject) scope."""
+
+    def __init__(self):
+        self.rows = {}
+        self.lengths = {}
+        self.terms = {}  # doc_id -> its distinct terms
+        self.postings = {}  # term -> {doc_id: term frequency}
+        self.total_length = 0
+
+    def upsert(self, doc_id, tokens, row):
+        self.remove(doc_id)
+        self.rows[doc_id] = row
+        self.lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+        counts = Counter(tokens)
+        self.terms[doc_id] = tuple(counts)
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id):
+        if doc_id not in self.rows:
+            return False
+        del self.rows[doc_id]
+        self.total_length -= self.lengths.pop(doc_id)
+        for term in self.terms.pop(doc_id):
+            del self.postings[term][doc_id]
+            if not self.postings[term]:
+                del self.postings[term]
+        return True
+
+
+class LexicalIndex:
+    """
+    In-process BM25 index over document text, partitioned by
+    (student_year, student_room, teacher_subject) like VectorIndex so the same
+    filters apply. IDF and average length come from the partitions searched.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._partitions = {}
+        self._locations = {}  # doc_id -> partition key
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def partition_key(row):
+        return (row.get('student_year'), row.get('student_room'), row.get('teacher_subject'))
+
+    def __len__(self):
+        return len(self._locations)
+
+    def upsert(self, doc_id, text, row):
+        tokens = tokenize(text or "")
+        key = self.partition_key(row)
+        with self._lock:
+            previous = self._locations.get(doc_id)
+            if previous is not None and previous != key:
+                self._partitions[previous].remove(doc_id)
+            self._partitions.setdefault(key, _Partition()).upsert(doc_id, tokens, row)
+            self._locations[doc_id] = key
+
+    def remove(self, doc_id):
+        with self._lock:
+            key = self._locations.pop(doc_id, None)
+            return self._partitions[key].remove(doc_id) if key is not None else False
+
+    def clear(self):
+        with self._lock:
+            self._partitions = {}
+            self._locations = {}
+
+    def search(self, query, k, year=None, room=None, subject=None):
+        """
+        Returns up to k (score, doc_id, row) triples, best first, restricted
+        to the partitions matching the filters. A None filter matches any value.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            partitions = [
+                partition for (p_year, p_room, p_subject), partition in self._partitions.items()
+                if (year is None or p_year == year)
+                and (room is None or p_room == room)
+                and (subject is None or p_subject == subject)
+            ]
+            count = sum(len(p.rows) for p in partitions)
+            if not count:
+                return []
+            average_length = max(sum(p.total_length for p in partitions) / count, 1.0)
+
+            scores = Counter()
+            rows = {}
+            for term in terms:
+                matching = [p for p in partitions if term in p.postings]
+                df = sum(len(p.postings[term]) for p in matching)
+                if not df:
+                    continue
+                idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                for partition in matching:
+                    for doc_id, tf in partition.postings[term].items():
+                        norm = self.k1 * (1 - self.b + self.b * partition.lengths[doc_id] / average_length)
+                        scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+                        rows[doc_id] = partition.rows[doc_id]
+
+        return [(score, doc_id, rows[doc_id]) for doc_id, score in scores.most_common(k)]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses ranked lists of ids: each id scores sum(1 / (k + rank)) over the
+    lists it appears in (rank starting at 1). Returns (id, score) pairs, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,284 @@
+import asyncio
+import inspect
+import json
+import logging
+import random
+import time
+
+import httpx
+
+from llm_scheduler import SchedulerBusy
+from metrics import UPSTREAM_ERRORS, log_event
+
+# Worth another try: rate limited, overloaded or a gateway in between failed
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """An upstream model call failed (after retries)."""
+
+
+class CircuitOpen(LLMError):
+    """The backend failed repeatedly and isn't called until reset_timeout passes."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend after failure_threshold failed calls in a row.
+    After reset_timeout one trial call is let through (half open): success
+    closes the circuit again, failure keeps it open for another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        # half open: one trial at a time, a trial that never reported back
+        # (cancelled request) expires after reset_timeout
+        now = time.monotonic()
+        if self._trial_at is None or now - self._trial_at >= self.reset_timeout:
+            self._trial_at = now
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_at = None
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class GeminiClient:
+    """
+    Gemini generateContent over a shared pooled httpx.AsyncClient.
+
+    Each attempt is bounded by timeout. Timeouts, connection errors, 429 and
+    5xx are retried up to max_retries times with exponential backoff and full
+    jitter (a Retry-After header wins). Calls that still fail count towards
+    the circuit breaker; while it is open calls fail fast with CircuitOpen.
+    """
+
+    name = "gemini"
+
+    def __init__(self, http_client, api_key, base_url="https://generativelanguage.googleapis.com/v1beta",
+                 model="gemini-2.0-flash", timeout=30.0, max_retries=3, backoff=0.5, max_backoff=8.0,
+                 breaker=None):
+        self.http_client = http_client
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+
+    def _body(self, prompt, json_output=False):
+        data = {"contents": [{"parts": [{"text": prompt}]}]}
+        if json_output:
+            data["generationConfig"] = {"responseMimeType": "application/json"}
+        return data
+
+    def _delay(self, attempt, response):
+        if response is not None:
+            retry_after = response.headers.get("retry-after", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def _send(self, method, data, stream=False, params=None):
+        """Returns a 200 response for method (left open when stream is set) or raises LLMError."""
+        if not self.api_key:
+            raise LLMError("APIKEYS is not set")
+        if not self.breaker.allow():
+            raise CircuitOpen("gemini circuit is open")
+
+        headers = {"Content-Type": "application/json", "X-goog-api-key": self.api_key}
+        url = f"{self.base_url}/models/{self.model}:{method}"
+        response = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._delay(attempt - 1, response))
+            response = None
+            try:
+                request = self.http_client.build_request("POST", url, params=params, headers=headers,
+                                                         json=data, timeout=self.timeout)
+                response = await self.http_client.send(request, stream=stream)
+            except httpx.TransportError as e:  # connect/read timeouts, refused, reset
+                error = f"{type(e).__name__}: {e}"
+                UPSTREAM_ERRORS.inc(backend="gemini", kind=type(e).__name__)
+            else:
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    return response
+                body = (await response.aread()).decode(errors="replace")
+                await response.aclose()
+                error = f"HTTP {response.status_code}: {body[:300]}"
+                UPSTREAM_ERRORS.inc(backend="gemini", kind=str(response.status_code))
+                if response.status_code not in RETRY_STATUS:
+                    # Gemini is up, it rejected this request (bad key, bad prompt)
+                    self.breaker.record_success()
+                    raise LLMError(error)
+            log_event("llm_attempt_failed", logging.WARNING, backend="gemini", attempt=attempt + 1,
+                      attempts=self.max_retries + 1, error=error)
+
+        self.breaker.record_failure()
+        raise LLMError(error)
+
+    async def generate(self, prompt, json_output=False, group=None):
+        response = await self._send("generateContent", self._body(prompt, json_output))
+        try:
+            return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+        except (KeyError, IndexError, ValueError) as e:
+            raise LLMError(f"unexpected Gemini response: {e!r}")
+
+    async def stream(self, prompt, group=None):
+        """Yields text chunks from streamGenerateContent (alt=sse)."""
+        response = await self._send("streamGenerateContent", self._body(prompt), stream=True, params={"alt": "sse"})
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                chunk = json.loads(line[5:])
+                for part in chunk["candidates"][0]["content"].get("parts", []):
+                    if part.get("text"):
+                        yield part["text"]
+        except (httpx.TransportError, KeyError, IndexError, ValueError) as e:
+            raise LLMError(f"Gemini stream interrupted: {e!r}")
+        finally:
+            await response.aclose()
+
+
+class OllamaClient:
+    """
+    The local Ollama model behind the same generate/stream interface, admitted
+    through an LLMScheduler (group is the fairness group, e.g. the class room).
+    The ollama.AsyncClient for host is created on first use unless client is given.
+    """
+
+    name = "ollama"
+
+    def __init__(self, model, scheduler, system=None, host=None, timeout=None, client=None):
+        self.model = model
+        self.scheduler = scheduler
+        self.system = system
+        self.host = host
+        self.timeout = timeout
+        self.client = client
+
+    def _client(self):
+        if self.client is None:
+            import ollama  # slow import, only paid once Ollama is actually used
+            self.client = ollama.AsyncClient(host=self.host, timeout=self.timeout)
+        return self.client
+
+    def _messages(self, prompt):
+        messages = [{"role": "system", "content": self.system}] if self.system else []
+        return messages + [{"role": "user", "content": prompt}]
+
+    async def ping(self):
+        """
+        Asks the server for its models (GET /api/tags). Returns whether
+        self.model is one of them, raises when the server can't be reached.
+        """
+        response = await self._client().list()
+        names = {(m.get("model") or m.get("name") or "").lower() for m in response["models"]}
+        model = self.model.lower()
+        return model in names or f"{model}:latest" in names
+
+    async def generate(self, prompt, json_output=False, group=None):
+        messages = self._messages(prompt)
+        options = {"format": "json"} if json_output else {}
+        try:
+            # identical prompts in flight share one generation
+            response = await self.scheduler.run(
+                (self.model, prompt, json_output), group,
+                lambda: self._client().chat(model=self.model, messages=messages, **options))
+        except SchedulerBusy:
+            raise
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(backend="ollama", kind=type(e).__name__)
+            raise LLMError(f"Ollama error: {e!r}")
+        return response['message']['content']
+
+    async def stream(self, prompt, group=None):
+        async with self.scheduler.slot(group):
+            try:
+                async for part in await self._client().chat(model=self.model, messages=self._messages(prompt), stream=True):
+                    content = part['message']['content']
+                    if content:
+                        yield content
+            except Exception as e:
+                UPSTREAM_ERRORS.inc(backend="ollama", kind=type(e).__name__)
+                raise LLMError(f"Ollama error: {e!r}")
+
+
+class FailoverClient:
+    """
+    Calls primary and falls back to fallback when it fails or its circuit is
+    open. fallback_prompt (a string, or a function returning one or an
+    awaitable of one) is sent to the fallback instead of prompt, e.g. a prompt
+    sized for a smaller context. A stream only fails over before its first chunk.
+    """
+
+    def __init__(self, primary, fallback=None):
+        self.primary = primary
+        self.fallback = fallback
+
+    async def _fallback_prompt(self, prompt, fallback_prompt):
+        if fallback_prompt is None:
+            return prompt
+        if not callable(fallback_prompt):
+            return fallback_prompt
+        value = fallback_prompt()
+        return await value if inspect.isawaitable(value) else value
+
+    async def generate(self, prompt, json_output=False, group=None, fallback_prompt=None):
+        """Returns (text, name of the backend that answered)."""
+        try:
+            return await self.primary.generate(prompt, json_output=json_output, group=group), self.primary.name
+        except LLMError as e:
+            if self.fallback is None:
+                raise
+            log_event("llm_fallback", logging.WARNING, backend=self.primary.name,
+                      fallback=self.fallback.name, error=str(e))
+        prompt = await self._fallback_prompt(prompt, fallback_prompt)
+        return await self.fallback.generate(prompt, json_output=json_output, group=group), self.fallback.name
+
+    async def stream(self, prompt, group=None, fallback_prompt=None):
+        """Yields (backend name, text chunk)."""
+        started = False
+        try:
+            async for text in self.primary.stream(prompt, group=group):
+                started = True
+                yield self.primary.name, text
+            return
+        except LLMError as e:
+            if started or self.fallback is None:
+                raise
+            log_event("llm_fallback", logging.WARNING, backend=self.primary.name,
+                      fallback=self.fallback.name, error=str(e))
+        async for text in self.fallback.stream(await self._fallback_prompt(prompt, fallback_prompt), group=group):
+            yield self.fallback.name, text
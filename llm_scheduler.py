@@ -0,0 +1,119 @@
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+
+class SchedulerBusy(Exception):
+    """Raised instead of queueing when the wait queue is full."""
+
+
+class LLMScheduler:
+    """
+    Admission control in front of a local model server.
+
+    - at most max_concurrency generations run at once
+    - waiting requests are queued per group (e.g. a class room) and slots are
+      handed out round-robin across groups, so one busy room can't starve others
+    - when max_queue requests are already waiting, new ones fail fast with
+      SchedulerBusy
+    - identical in-flight requests (same key) share one generation
+    """
+
+    def __init__(self, max_concurrency=2, max_queue=32):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self._queues = OrderedDict()  # group -> deque of waiter futures
+        self._inflight = {}  # key -> [task of the shared generation, callers waiting on it]
+
+    @property
+    def queued(self):
+        return sum(len(q) for q in self._queues.values())
+
+    async def run(self, key, group, call):
+        """
+        Runs call() (a coroutine function) inside a slot, or awaits the result
+        of an identical in-flight call with the same key.
+
+        The generation runs in its own task and every caller awaits it through
+        a shield, so a caller that is cancelled (client disconnected) doesn't
+        cancel the result the others wait for. The generation is cancelled
+        once nobody waits for it anymore.
+        """
+        entry = self._inflight.get(key)
+        if entry is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self._generate(group, call))
+            entry = self._inflight[key] = [task, 0]
+            task.add_done_callback(lambda t, entry=entry: self._finished(key, entry, t))
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                # last waiter gone, free the slot; later callers start a new generation
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+                task.cancel()
+
+    async def _generate(self, group, call):
+        async with self.slot(group):
+            return await call()
+
+    def _finished(self, key, entry, task):
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # every waiter may be gone, don't warn about it
+
+    @asynccontextmanager
+    async def slot(self, group):
+        """Holds one generation slot for the duration of the block."""
+        await self._acquire(group)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, group):
+        if self.active < self.max_concurrency and not self._queues:
+            self.active += 1
+            return
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerBusy()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(group, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed to us just before the cancel, pass it on
+                self._release()
+            else:
+                queue = self._queues.get(group)
+                if queue is not None and waiter in queue:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[group]
+            raise
+
+    def _release(self):
+        # hand the slot straight to the next group in round-robin order
+        while self._queues:
+            group, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(group)
+            else:
+                del self._queues[group]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
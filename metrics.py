@@ -0,0 +1,252 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Set by the request middleware: the request id and the time spent per stage
+request_id = contextvars.ContextVar("request_id", default=None)
+_stages = contextvars.ContextVar("stages", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            if position < len(self.buckets):
+                state[position] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', '+Inf')])} {state[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(state[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class Callback:
+    """
+    A value read when /metrics is scraped from a counter the owning component
+    already keeps. fn returns a number or {label values tuple: number}.
+    """
+
+    def __init__(self, name, documentation, kind, fn, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.fn()
+        except Exception as e:
+            log_event("metric_error", logging.WARNING, metric=self.name, error=str(e))
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    """Metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, kind, fn, labelnames=()):
+        self._metrics[name] = Callback(name, documentation, kind, fn, labelnames)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram(
+    "toth_stage_seconds", "Time spent in each stage of a request", ("stage",))
+HTTP_REQUESTS = REGISTRY.counter(
+    "toth_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_SECONDS = REGISTRY.histogram(
+    "toth_http_request_seconds", "HTTP request latency until the response starts", ("method", "route"))
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "toth_upstream_errors_total", "Failed calls to Gemini, Ollama and Supabase", ("backend", "kind"))
+
+
+# structured log
+
+logger = logging.getLogger("toth")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+            "request_id": request_id.get(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging():
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """Writes one JSON log line tagged with the current request id."""
+    logger.log(level, event, extra={"fields": fields})
+
+
+# tracing
+
+_tracer = None
+
+
+def init_tracing():
+    """
+    Exports spans with OpenTelemetry when OTEL_EXPORTER_OTLP_ENDPOINT is set and
+    opentelemetry-sdk / opentelemetry-exporter-otlp are installed.
+    """
+    global _tracer
+    if _tracer is not None or not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return _tracer
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as e:
+        log_event("tracing_disabled", logging.WARNING, error=str(e))
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "toth-api")}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("toth")
+    return _tracer
+
+
+@contextmanager
+def span(stage):
+    """
+    Times one stage into toth_stage_seconds, the per-request stage breakdown
+    in the access log and, when enabled, an OpenTelemetry span.
+    """
+    start = time.perf_counter()
+    with _tracer.start_as_current_span(stage) if _tracer is not None else nullcontext():
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            STAGE_SECONDS.observe(elapsed, stage=stage)
+            stages = _stages.get()
+            if stages is not None:
+                stages[stage] = round(stages.get(stage, 0.0) + elapsed * 1000, 2)
+
+
+@contextmanager
+def request_context(method, route_name, incoming_id):
+    """
+    Wraps one HTTP request: sets the request id, collects stage timings and
+    writes the access log line. Yields a dict the caller fills with
+    "status" and "route".
+    """
+    id_token = request_id.set(incoming_id)
+    stages_token = _stages.set({})
+    info = {"status": 500, "route": route_name}
+    start = time.perf_counter()
+    span_context = (_tracer.start_as_current_span(f"{method} {route_name}")
+                    if _tracer is not None else nullcontext())
+    try:
+        with span_context:
+            yield info
+    finally:
+        elapsed = time.perf_counter() - start
+        HTTP_REQUESTS.inc(method=method, route=info["route"], status=str(info["status"]))
+        HTTP_SECONDS.observe(elapsed, method=method, route=info["route"])
+        log_event("request", method=method, route=info["route"], status=info["status"],
+                  duration_ms=round(elapsed * 1000, 2), stages=_stages.get())
+        _stages.reset(stages_token)
+        request_id.reset(id_token)
@@ -0,0 +1,191 @@
+import asyncio
+import copy
+import json
+import logging
+import re
+import time
+import uuid
+from datetime import datetime
+
+from metrics import log_event
+
+CHOICE_KEYS = ("a", "b", "c", "d")
+QUESTIONS_PER_QUIZ = 5
+
+
+def _normalize_question(item):
+    """Coerces the common ways an LLM bends the schema back into it."""
+    if not isinstance(item, dict):
+        return item
+    item = {str(key).strip().lower(): value for key, value in item.items()}
+    choices = item.get("choices", item.get("options"))
+    if isinstance(choices, list):
+        choices = dict(zip(CHOICE_KEYS, choices))
+    if isinstance(choices, dict):
+        choices = {str(key).strip().lower().rstrip(").:"): str(value).strip() for key, value in choices.items()}
+    correct = item.get("correct", item.get("answer"))
+    if isinstance(correct, str):
+        key = correct.strip().lower().rstrip(").:")
+        if key not in CHOICE_KEYS and isinstance(choices, dict):
+            # the answer was given as the choice text instead of its letter
+            key = next((k for k, v in choices.items() if v == correct.strip()), key)
+        correct = key
+    return {"question": str(item.get("question", "")).strip(), "choices": choices, "correct": correct}
+
+
+def repair_quiz_json(text):
+    """
+    Parses a quiz out of raw LLM output: strips code fences and surrounding
+    prose, removes trailing commas and normalizes field names.
+    Raises ValueError if nothing usable is found.
+    """
+    if "```" in text:
+        fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.S)
+        if fenced:
+            text = fenced.group(1)
+    start, end = text.find("["), text.rfind("]")
+    if start != -1 and end > start:
+        text = text[start:end + 1]
+    text = re.sub(r",\s*([\]}])", r"\1", text)
+    text = text.replace("“", '"').replace("”", '"')
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get("questions", data.get("quiz", [data]))
+    if not isinstance(data, list):
+        raise ValueError("quiz is not a list")
+    return [_normalize_question(item) for item in data]
+
+
+def validate_quiz(questions):
+    """Returns a list of problems, empty when the quiz matches the schema."""
+    errors = []
+    if len(questions) != QUESTIONS_PER_QUIZ:
+        errors.append(f"expected {QUESTIONS_PER_QUIZ} questions, got {len(questions)}")
+    for i, item in enumerate(questions, 1):
+        if not isinstance(item, dict) or not item.get("question"):
+            errors.append(f"question {i}: missing question text")
+            continue
+        choices = item.get("choices")
+        if not isinstance(choices, dict) or sorted(choices) != list(CHOICE_KEYS):
+            errors.append(f"question {i}: choices must be a, b, c, d")
+        elif any(not value for value in choices.values()) or len(set(choices.values())) != 4:
+            errors.append(f"question {i}: choices must be 4 different non-empty answers")
+        if item.get("correct") not in CHOICE_KEYS:
+            errors.append(f"question {i}: correct must be one of a, b, c, d")
+    return errors
+
+
+class RateLimiter:
+    """Spaces out call starts to at most rate_per_minute (wait() before each call)."""
+
+    def __init__(self, rate_per_minute):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class QuizJobManager:
+    """
+    Runs quiz generation for many (year, room, subject) scopes as a background
+    job. Scopes are generated concurrently (bounded by concurrency) and each
+    finished quiz is handed to store().
+
+    generate(k, room, year, subject, before_call) -> {"error": bool, "data" | "message"},
+    before_call is awaited before every LLM call and spaces them to rate_per_minute
+    store(scope, questions) -> stored quiz id
+    save(job) / load(job_id) persist the job status so any worker can answer a
+    poll, without them it is only known to the process that runs the job.
+    """
+
+    def __init__(self, generate, store, concurrency=4, rate_per_minute=30, max_jobs=200, save=None, load=None):
+        self.generate = generate
+        self.store = store
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(rate_per_minute)
+        self.max_jobs = max_jobs
+        self.save = save
+        self.load = load
+        self.jobs = {}
+        self._save_locks = {}
+        self._tasks = set()
+
+    async def submit(self, scopes, k=None):
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "created_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "scopes": [dict(scope, status="queued", quiz_id=None, error=None) for scope in scopes],
+        }
+        self.jobs[job_id] = job
+        finished = [old_id for old_id, old in self.jobs.items() if old["finished_at"]]
+        for old_id in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[old_id]
+        # saved before the id is handed out, a poll can land on another worker right away
+        await self._save(job)
+        task = asyncio.create_task(self._run(job, k))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None and self.load is not None:
+            try:
+                job = await self.load(job_id)
+            except Exception as e:
+                log_event("quiz_job_load_error", logging.WARNING, job_id=job_id, error=str(e))
+        return job
+
+    async def _save(self, job):
+        if self.save is None:
+            return
+        # one write at a time per job so an older snapshot never lands last
+        async with self._save_locks.setdefault(job["id"], asyncio.Lock()):
+            try:
+                await self.save(copy.deepcopy(job))
+            except Exception as e:
+                log_event("quiz_job_save_error", logging.WARNING, job_id=job["id"], error=str(e))
+
+    async def _run(self, job, k):
+        job["status"] = "running"
+        await self._save(job)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_scope(scope):
+            async with semaphore:
+                scope["status"] = "running"
+                try:
+                    result = await self.generate(k, scope.get("room_id"), scope.get("year_id"),
+                                                 scope.get("subject_id"), self.rate_limiter.wait)
+                    if result.get("error"):
+                        scope["status"], scope["error"] = "failed", result.get("message")
+                        return
+                    scope["quiz_id"] = await self.store(scope, result["data"])
+                    scope["status"] = "done"
+                except Exception as e:
+                    log_event("quiz_job_scope_error", logging.ERROR, job_id=job["id"], scope=scope,
+                              error=str(e))
+                    scope["status"], scope["error"] = "failed", str(e)
+            await self._save(job)
+
+        await asyncio.gather(*(run_scope(scope) for scope in job["scopes"]))
+        failed = sum(1 for scope in job["scopes"] if scope["status"] == "failed")
+        job["status"] = "done" if not failed else "partial" if failed < len(job["scopes"]) else "failed"
+        job["finished_at"] = datetime.now().isoformat()
+        await self._save(job)
+        self._save_locks.pop(job["id"], None)
@@ -0,0 +1,66 @@
+"""
+Re-embeds stored documents and passages with the current EMBEDDING_MODEL.
+
+run with
+EMBEDDING_MODEL=paraphrase-multilingual-MiniLM-L12-v2 python reembed_documents.py
+python reembed_documents.py --table documents --page-size 200
+
+Needed after switching EMBEDDING_MODEL: query and document vectors must come
+from the same model. Restart the API (or call reload_index()) afterwards.
+"""
+import argparse
+
+from embedding_codec import encode_embedding
+from func import EMBEDDING_STORAGE_FORMAT, embedder, get_supabase, passage_text, prepare_document, set_embedding
+
+
+def document_text(row):
+    # the same text add_document embedded when the row was inserted
+    context_text, _ = prepare_document(dict(row, time_summit=str(row['created_at'])))
+    return context_text
+
+
+def reembed(table, columns, text, page_size):
+    supabase = get_supabase()
+    last_id = 0
+    updated = 0
+    while True:
+        rows = supabase.table(table).select(columns).gt(
+            'id', last_id).order('id').limit(page_size).execute().data
+        if not rows:
+            break
+        vectors = embedder.encode_batch([text(row) for row in rows])
+        for row, vector in zip(rows, vectors):
+            if table == 'documents':
+                values = set_embedding({}, vector)
+            else:
+                # document_passages has no embedding_vec column
+                values = {"embedding": encode_embedding(vector, EMBEDDING_STORAGE_FORMAT)}
+            supabase.table(table).update(values).eq('id', row['id']).execute()
+        updated += len(rows)
+        last_id = rows[-1]['id']
+        print(f"{table}: {updated} rows re-embedded")
+        if len(rows) < page_size:
+            break
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--table", choices=["documents", "document_passages", "all"], default="all")
+    parser.add_argument("--page-size", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.table in ("documents", "all"):
+        reembed('documents', "id, content, created_at, time_of_record, teacher_name, "
+                "teacher_subject, student_year, student_room", document_text, args.page_size)
+    if args.table in ("document_passages", "all"):
+        try:
+            reembed('document_passages', "id, content, created_at, teacher_name, teacher_subject, "
+                    "student_year, student_room", lambda row: passage_text(row, row['content']), args.page_size)
+        except Exception as e:
+            print(f"Passage re-embedding skipped (is database/document_passages.sql applied?): {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from vector_index import normalize
+
+
+def _matches(cached_filter, value):
+    # A cached answer for "any room" also depends on a document added to room 301
+    return cached_filter is None or cached_filter == value
+
+
+class MemoryCacheBackend:
+    """LRU + TTL cache of (scope, normalized query vector, response) kept in process."""
+
+    def __init__(self, max_entries=1000, ttl=3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # id -> (scope, vector, response, created)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, scope, vector, threshold):
+        now = time.time()
+        with self._lock:
+            candidates = [(entry_id, entry) for entry_id, entry in self._entries.items()
+                          if entry[0] == scope and now - entry[3] < self.ttl]
+            if not candidates:
+                return None
+            scores = np.stack([entry[1] for _, entry in candidates]) @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                return None
+            entry_id, entry = candidates[best]
+            self._entries.move_to_end(entry_id)
+            return entry[2]
+
+    def store(self, scope, vector, response):
+        with self._lock:
+            self._entries[self._next_id] = (scope, vector, response, time.time())
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, year, room, subject):
+        with self._lock:
+            stale = [entry_id for entry_id, (scope, _, _, _) in self._entries.items()
+                     if _matches(scope[1], year) and _matches(scope[2], room) and _matches(scope[3], subject)]
+            for entry_id in stale:
+                del self._entries[entry_id]
+        return len(stale)
+
+
+class SQLiteCacheBackend:
+    """
+    Same cache stored in a local SQLite file, so it survives restarts and is
+    shared by every uvicorn worker on the host.
+    """
+
+    def __init__(self, path, max_entries=1000, ttl=3600.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    def _connection(self):
+        """
+        The connection of this process, opened on first use. A connection
+        inherited through fork (gunicorn --preload) must not be used.
+        """
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._pid = os.getpid()
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    backend TEXT NOT NULL,
+                    student_year INTEGER,
+                    student_room INTEGER,
+                    teacher_subject TEXT,
+                    embedding BLOB NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )""")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS response_cache_scope ON response_cache "
+                "(backend, student_year, student_room, teacher_subject)")
+        return self._db
+
+    def lookup(self, scope, vector, threshold):
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            rows = db.execute(
+                "SELECT id, embedding, response FROM response_cache WHERE backend = ? "
+                "AND student_year IS ? AND student_room IS ? AND teacher_subject IS ? "
+                "AND created_at > ?", (*scope, now - self.ttl)).fetchall()
+            if not rows:
+                return None
+            scores = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                return None
+            db.execute("UPDATE response_cache SET last_used = ? WHERE id = ?", (now, rows[best][0]))
+            return rows[best][2]
+
+    def store(self, scope, vector, response):
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "INSERT INTO response_cache (backend, student_year, student_room, teacher_subject, "
+                "embedding, response, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*scope, vector.tobytes(), response, now, now))
+            db.execute(
+                "DELETE FROM response_cache WHERE created_at <= ? OR id IN (SELECT id FROM response_cache "
+                "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (now - self.ttl, self.max_entries))
+
+    def invalidate(self, year, room, subject):
+        with self._lock:
+            cursor = self._connection().execute(
+                "DELETE FROM response_cache WHERE (student_year IS NULL OR student_year = ?) "
+                "AND (student_room IS NULL OR student_room = ?) "
+                "AND (teacher_subject IS NULL OR teacher_subject = ?)", (year, room, subject))
+            return cursor.rowcount
+
+
+class ResponseCache:
+    """
+    Semantic cache of generated answers. A question hits when a cached question
+    in the same scope (LLM backend, year, room, subject) has a cosine similarity
+    of at least threshold.
+    """
+
+    def __init__(self, backend, threshold=0.95):
+        self.backend = backend
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def scope(llm, yearId, roomId, subjectId):
+        return (llm, yearId, roomId, subjectId)
+
+    def get(self, scope, query_embedding):
+        response = self.backend.lookup(scope, normalize(query_embedding).reshape(-1), self.threshold)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def put(self, scope, query_embedding, response):
+        self.backend.store(scope, normalize(query_embedding).reshape(-1), response)
+
+    def invalidate(self, year, room, subject):
+        """Drops every cached answer whose scope includes a document of (year, room, subject)."""
+        return self.backend.invalidate(year, room, subject)
+
+
+def create_response_cache(kind, path="response_cache.sqlite3", threshold=0.95, max_entries=1000, ttl=3600.0):
+    """Builds the cache selected by RESPONSE_CACHE: 'memory', 'sqlite' or 'off' (returns None)."""
+    if kind == "memory":
+        return ResponseCache(MemoryCacheBackend(max_entries, ttl), threshold)
+    if kind == "sqlite":
+        return ResponseCache(SQLiteCacheBackend(path, max_entries, ttl), threshold)
+    return None
@@ -0,0 +1,67 @@
+import logging
+import threading
+import time
+
+from metrics import log_event
+
+
+class SettingsCache:
+    """
+    Keeps the result of fetch() in memory with stale-while-revalidate refresh.
+
+    - younger than ttl: served as is
+    - older than ttl but younger than max_stale: served as is while one
+      background thread fetches a new copy
+    - older than max_stale (or never loaded): fetched inline
+    """
+
+    def __init__(self, fetch, ttl=5.0, max_stale=60.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._value = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def age(self):
+        return time.monotonic() - self._loaded_at if self._value is not None else None
+
+    def get(self):
+        age = self.age
+        if age is not None and age < self.ttl:
+            return self._value
+        if age is not None and age < self.max_stale:
+            self._refresh_in_background()
+            return self._value
+        return self.refresh()
+
+    def refresh(self):
+        """Fetches a new copy inline. Raises if the fetch fails."""
+        value = self.fetch()
+        with self._lock:
+            self._value = value
+            self._loaded_at = time.monotonic()
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh,
+                         name="settings-refresh", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # Keep serving the stale copy, the next get() after max_stale retries inline
+            log_event("settings_refresh_error", logging.ERROR, error=str(e))
+        finally:
+            self._refreshing = False
@@ -0,0 +1,71 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import func
+import toth_api
+
+client = TestClient(toth_api.app)
+
+
+@pytest.mark.parametrize("body", ["{bad json", "5", '"text"', '{"documents": 3}'])
+def test_bad_bodies_are_rejected_with_400(body):
+    response = client.post("/add-documents", content=body, headers={"content-type": "application/json"})
+    assert response.status_code == 400
+    assert response.json()["error"] is True
+
+
+def test_chunk_size_must_be_positive():
+    response = client.post("/add-documents?chunk_size=0", content="[]", headers={"content-type": "application/json"})
+    assert response.status_code == 422
+
+
+def lesson(content="การสังเคราะห์ด้วยแสง"):
+    return {"content": content, "time_summit": "2025-09-01T09:00:00Z", "time_of_record": "09:30:00",
+            "teacher_name": "อาจารย์สมชาย", "teacher_subject": "bio", "student_year": 3, "student_room": 301}
+
+
+def test_invalid_ndjson_lines_report_the_json_error(monkeypatch):
+    async def add_documents(docs, chunk_size):
+        return {"inserted": len(docs), "failed": 0,
+                "results": [{"index": i, "status": "ok", "id": i + 1} for i in range(len(docs))]}
+
+    monkeypatch.setattr(toth_api, "add_documents", add_documents)
+    body = json.dumps(lesson(), ensure_ascii=False) + "\n{not json\n" + json.dumps(lesson(), ensure_ascii=False)
+    response = client.post("/add-documents", content=body.encode(), headers={"content-type": "application/x-ndjson"})
+    result = response.json()["content"]
+    assert (result["inserted"], result["failed"]) == (2, 1)
+    assert [r["status"] for r in result["results"]] == ["ok", "error", "ok"]
+    assert result["results"][1]["error"].startswith("invalid JSON: ")
+
+
+class ShortInsertClient:
+    """Supabase stand-in whose multi-row insert returns one row less than it was sent."""
+
+    def table(self, name):
+        return self
+
+    def insert(self, rows):
+        self.rows = rows
+        return self
+
+    async def execute(self):
+        return SimpleNamespace(data=[dict(row, id=i + 1) for i, row in enumerate(self.rows[:-1])])
+
+
+def test_rows_missing_from_the_insert_response_are_reported(monkeypatch):
+    async def get_async_supabase():
+        return ShortInsertClient()
+
+    monkeypatch.setattr(func, "check_system", lambda: True)
+    monkeypatch.setattr(func, "get_async_supabase", get_async_supabase)
+    monkeypatch.setattr(func.embedder, "encode_batch", lambda texts: np.ones((len(texts), 4), dtype=np.float32))
+    monkeypatch.setattr(func, "PASSAGE_CHUNKING", False)
+    monkeypatch.setattr(func, "response_cache", None)
+    result = asyncio.run(func.add_documents([lesson(), lesson(), lesson()]))
+    assert (result["inserted"], result["failed"]) == (2, 1)
+    assert result["results"][2] == {"index": 2, "status": "error", "error": "no row returned"}
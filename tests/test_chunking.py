@@ -0,0 +1,40 @@
+from chunking import chunk_text, merge_passages
+
+SENTENCES = [f"Sentence number {i} talks about cells and energy." for i in range(30)]
+TEXT = " ".join(SENTENCES)
+
+
+def test_short_text_is_one_passage():
+    assert chunk_text("  short lesson  ", max_chars=400) == [("short lesson", 0)]
+    assert chunk_text("   ") == []
+
+
+def test_passages_respect_max_chars_and_overlap():
+    passages = chunk_text(TEXT, max_chars=200, overlap_chars=60)
+    assert len(passages) > 1
+    assert passages[0][1] == 0
+    for (passage, overlap), (previous, _) in zip(passages[1:], passages):
+        assert len(passage) <= 200
+        assert 0 < overlap <= 60
+        # the overlap is the tail of the previous passage
+        assert previous.endswith(passage[:overlap].strip())
+
+
+def test_merge_passages_restores_the_text():
+    passages = chunk_text(TEXT, max_chars=200, overlap_chars=60)
+    assert merge_passages(passages) == TEXT
+    assert merge_passages(passages[:1]) == passages[0][0]
+
+
+def test_long_sentences_are_hard_split():
+    text = "x" * 950
+    passages = chunk_text(text, max_chars=400, overlap_chars=80)
+    assert all(len(passage) <= 400 for passage, _ in passages)
+    assert "".join(passage for passage, _ in passages) == text
+
+
+def test_thai_clauses_are_split_on_spaces():
+    text = " ".join(["วันนี้เราเรียนเรื่องการสังเคราะห์ด้วยแสงของพืช"] * 20)
+    passages = chunk_text(text, max_chars=120, overlap_chars=50)
+    assert len(passages) > 1
+    assert all(len(passage) <= 120 for passage, _ in passages)
@@ -0,0 +1,52 @@
+import numpy as np
+
+import func
+from context_builder import build_context, estimate_tokens
+
+
+def doc(score, content, vector=None):
+    return (score, content, "2025-07-01", "10:00:00", "ครูสมชาย", "bio", 3, 301, vector)
+
+
+def test_low_scores_are_cut_relative_to_the_highest_score():
+    docs = [doc(0.8, "a"), doc(0.5, "b"), doc(0.3, "c")]
+    context, stats = build_context(docs, 1000, min_score_ratio=0.5)
+    assert "Content: a" in context and "Content: b" in context
+    assert stats["dropped_low_score"] == 1
+
+
+def test_cut_off_uses_the_best_score_not_the_first_doc():
+    # hybrid retrieval orders by fused rank, a keyword hit can come first
+    docs = [doc(0.3, "keyword hit"), doc(0.8, "semantic hit"), doc(0.2, "weak")]
+    _, stats = build_context(docs, 1000, min_score_ratio=0.5)
+    assert stats["dropped_low_score"] == 1
+
+
+def test_near_duplicates_are_dropped():
+    v = np.array([1.0, 0.0], dtype=np.float32)
+    docs = [doc(0.9, "a", v), doc(0.9, "a again", v), doc(0.8, "b", np.array([0.0, 1.0], dtype=np.float32))]
+    _, stats = build_context(docs, 1000, vectors=[d[8] for d in docs])
+    assert stats["dropped_duplicate"] == 1
+
+
+def test_budget_truncates_the_first_doc():
+    context, stats = build_context([doc(0.9, "ก" * 2000)], 100)
+    assert estimate_tokens(context) <= 100
+    assert stats["tokens_saved"] > 0
+
+
+def test_keyword_matches_are_not_cut_for_a_low_score():
+    docs = [doc(0.8, "semantic hit"), doc(0.1, "keyword hit"), doc(0.1, "weak")]
+    context, stats = build_context(docs, 1000, min_score_ratio=0.5, keyword_matches=[False, True, False])
+    assert "Content: keyword hit" in context
+    assert stats["dropped_low_score"] == 1
+
+
+def test_fallback_context_is_not_counted_twice():
+    docs = [doc(0.9, "a") + (False,), doc(0.8, "b") + (False,)]
+    before = dict(func.context_totals)
+    func.build_context(docs, "gemini")
+    counted = dict(func.context_totals)
+    assert counted["tokens_used"] > before["tokens_used"]
+    func.build_context(docs, "ollama", count=False)
+    assert func.context_totals == counted
@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+import pytest
+
+from embedding_codec import FORMATS, decode_embedding, encode_embedding
+
+VECTOR = np.linspace(-1.0, 1.0, 384).astype(np.float32)
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_round_trip(fmt):
+    decoded = decode_embedding(encode_embedding(VECTOR, fmt))
+    assert decoded.dtype == np.float32
+    assert decoded.shape == VECTOR.shape
+    tolerance = {"json": 1e-6, "float32": 0, "float16": 1e-3, "int8": 1 / 127}[fmt]
+    assert np.max(np.abs(decoded - VECTOR)) <= tolerance
+
+
+def test_float32_is_exact_and_compact():
+    encoded = encode_embedding(VECTOR, "float32")
+    assert encoded.startswith("f32:")
+    assert np.array_equal(decode_embedding(encoded), VECTOR)
+    assert len(encoded) < len(json.dumps(VECTOR.tolist())) / 2
+
+
+def test_reads_legacy_and_database_formats():
+    assert np.allclose(decode_embedding("[0.5, -1.0]"), [0.5, -1.0])
+    assert np.allclose(decode_embedding([0.5, -1.0]), [0.5, -1.0])
+    hex_bytes = "\\x" + np.array([0.5, -1.0], dtype=np.float32).tobytes().hex()
+    assert np.allclose(decode_embedding(hex_bytes), [0.5, -1.0])
+
+
+def test_int8_zero_vector():
+    assert np.array_equal(decode_embedding(encode_embedding(np.zeros(4), "int8")), np.zeros(4))
+
+
+def test_unknown_formats_raise():
+    with pytest.raises(ValueError):
+        encode_embedding(VECTOR, "bf16")
+    with pytest.raises(ValueError):
+        decode_embedding("x9:AAAA")
@@ -0,0 +1,22 @@
+import func
+
+
+def passage(passage_id, document_id, passage_index, content):
+    return {"id": passage_id, "document_id": document_id, "passage_index": passage_index, "content": content}
+
+
+def test_passages_are_merged_with_their_neighbours(monkeypatch):
+    words = ["one.", "two.", "three.", "four.", "five.", "six.", "seven."]
+    monkeypatch.setattr(func, "_document_passages", {7: {i: (word, 0) for i, word in enumerate(words)}})
+    hits = [(0.9, passage(11, 7, 1, "two."), None), (0.8, {"id": 3, "content": "whole"}, None),
+            (0.7, passage(15, 7, 5, "six."), None)]
+    grouped = func.group_passages(hits, 2)
+    assert [(score, row["content"]) for score, row, _ in grouped] == [
+        (0.9, "one. two. three. … five. six. seven."), (0.8, "whole")]
+
+
+def test_passage_hit_is_kept_when_its_document_map_is_gone(monkeypatch):
+    # reload_index cleared the passage maps between the search and the grouping
+    monkeypatch.setattr(func, "_document_passages", {})
+    grouped = func.group_passages([(0.9, passage(11, 7, 1, "two."), None)], 5)
+    assert [row["content"] for _, row, _ in grouped] == ["two."]
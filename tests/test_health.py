@@ -0,0 +1,106 @@
+import asyncio
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import func
+import toth_api
+from health import HealthMonitor
+
+client = TestClient(toth_api.app)
+
+
+class Dependency:
+    """A health check that counts its calls and fails while down is set."""
+
+    def __init__(self, details=None):
+        self.calls = 0
+        self.down = False
+        self.details = details or {}
+
+    async def check(self):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("connection refused")
+        return self.details
+
+
+def test_snapshot_reads_the_last_result_without_running_checks():
+    database = Dependency({"documents": 42})
+    monitor = HealthMonitor()
+    monitor.add("database", database.check)
+    assert monitor.snapshot() == {"ok": False, "checks": {"database": {"status": "unknown", "required": True}}}
+
+    asyncio.run(monitor.check_now())
+    for _ in range(3):
+        snapshot = monitor.snapshot()
+    assert database.calls == 1
+    assert snapshot["ok"] is True
+    assert snapshot["checks"]["database"]["status"] == "ok"
+    assert snapshot["checks"]["database"]["documents"] == 42
+
+
+def test_failures_and_timeouts_are_reported_and_optional_checks_only_reported():
+    async def hangs():
+        await asyncio.sleep(1)
+
+    database, ollama = Dependency(), Dependency()
+    ollama.down = True
+    monitor = HealthMonitor(timeout=0.01)
+    monitor.add("database", database.check)
+    monitor.add("ollama", ollama.check, required=False)
+    monitor.add("slow", hangs, required=False)
+    checks = asyncio.run(monitor.check_now())["checks"]
+    assert checks["ollama"]["details"] == "ConnectionError: connection refused"
+    assert checks["slow"]["details"] == "no answer within 0.01s"
+    assert monitor.snapshot()["ok"] is True
+
+    database.down = True
+    asyncio.run(monitor.check_now("database"))
+    assert monitor.snapshot()["ok"] is False
+    assert ollama.calls == 1
+
+
+def test_ready_flips_with_the_background_database_check(monkeypatch):
+    database = Dependency({"documents": 42})
+    monitor = HealthMonitor()
+    monitor.add("database", database.check)
+    monkeypatch.setattr(func, "health_monitor", monitor)
+    monkeypatch.setattr(func, "RETRIEVAL_MODE", "database")
+    monkeypatch.setattr(func, "embedder", SimpleNamespace(loaded=True, model_name="e5", backend="torch"))
+
+    assert client.get("/ready").status_code == 503  # the first check hasn't run yet
+    asyncio.run(monitor.check_now())
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["checks"]["database"]["status"] == "ok"
+
+    database.down = True
+    asyncio.run(monitor.check_now())
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["checks"]["database"]["details"] == "ConnectionError: connection refused"
+    assert database.calls == 2  # probes only read the last result
+
+
+def test_ready_waits_for_the_embedding_model(monkeypatch):
+    monitor = HealthMonitor()
+    monkeypatch.setattr(func, "health_monitor", monitor)
+    monkeypatch.setattr(func, "RETRIEVAL_MODE", "database")
+    monkeypatch.setattr(func, "embedder", SimpleNamespace(loaded=False, model_name="e5", backend="torch"))
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["checks"]["embedding_model"]["status"] == "loading"
+
+
+def test_health_reports_the_cached_row_count(monkeypatch):
+    database = Dependency({"documents": 42})
+    monitor = HealthMonitor()
+    monitor.add("database", database.check)
+    monkeypatch.setattr(func, "health_monitor", monitor)
+
+    for _ in range(3):
+        status = client.get("/health").json()["status"]
+    assert status["status"] == "ok"
+    assert status["details"] == "Connected. Rows in documents: 42"
+    assert database.calls == 1  # run once on the first request, then read from memory
@@ -0,0 +1,72 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
+import fake_supabase  # noqa: E402
+import func  # noqa: E402
+from embedding_codec import encode_embedding  # noqa: E402
+
+
+def document(doc_id, content="แรงและการเคลื่อนที่"):
+    return {"id": doc_id, "content": content, "embedding": encode_embedding(np.eye(4, dtype=np.float32)[doc_id % 4]),
+            "created_at": "2025-09-01", "time_of_record": "09:00:00", "teacher_name": "อาจารย์สมชาย",
+            "teacher_subject": "physics", "student_year": 3, "student_room": 301}
+
+
+@pytest.fixture
+def documents(monkeypatch):
+    monkeypatch.setattr(func, "PASSAGE_CHUNKING", False)
+    monkeypatch.setattr(func, "response_cache", None)
+    rows = [document(i) for i in (1, 2, 3, 5)]
+    fake_supabase.install(func, {"documents": rows})
+    func.reload_index()
+    yield rows
+    func.index.clear()
+
+
+def test_rows_committed_late_below_the_high_water_mark_are_picked_up(documents):
+    assert len(func.index) == 4
+    documents.insert(3, document(4))
+    documents.append(document(6))
+    assert func.sync_index() == 2
+    assert len(func.index) == 6
+    assert func.sync_index() == 0
+
+
+def test_rows_this_worker_inserted_are_not_added_again(documents):
+    documents.append(document(6))
+    func.documents_inserted([document(6)])
+    assert func.sync_index() == 0
+    assert len(func.index) == 5
+
+
+def test_gaps_older_than_the_lookback_are_forgotten(documents, monkeypatch):
+    monkeypatch.setattr(func, "INDEX_SYNC_LOOKBACK", 2)
+    documents.append(document(9))
+    func.sync_index()
+    assert func._index_sync_gaps["high_water_id"] == {8}
+
+
+def test_gaps_are_fetched_in_batches(documents, monkeypatch):
+    requests = []
+    fetch = func._fetch_rows_by_id
+    monkeypatch.setattr(func, "INDEX_SYNC_GAP_BATCH", 2)
+    monkeypatch.setattr(func, "_fetch_rows_by_id", lambda *args: requests.append(args[2]) or fetch(*args))
+    documents.append(document(10))
+    func.sync_index()
+    assert requests == [[4]]
+    func.sync_index()
+    assert requests[1:] == [[4, 6], [7, 8], [9]]
+
+
+def test_failed_gap_lookup_does_not_block_new_rows(documents, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("414 Request-URI Too Large")
+
+    monkeypatch.setattr(func, "_fetch_rows_by_id", fail)
+    documents.append(document(6))
+    assert func.sync_index() == 1
+    assert func._index_sync["high_water_id"] == 6
@@ -0,0 +1,91 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import func
+import lexical_index
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+from vector_index import VectorIndex
+
+
+@pytest.fixture(autouse=True)
+def without_pythainlp(monkeypatch):
+    # the bigram fallback is what runs when pythainlp isn't installed
+    monkeypatch.setattr(lexical_index, "_word_tokenize", False)
+
+
+def row(doc_id, content, year=3, room=301, subject="bio"):
+    return {"id": doc_id, "content": content, "created_at": "2025-07-01", "time_of_record": "10:00:00",
+            "teacher_name": "ครูสมชาย", "teacher_subject": subject, "student_year": year, "student_room": room}
+
+
+@pytest.mark.parametrize("text, tokens", [
+    ("DNA and RNA 2", ["dna", "and", "rna", "2"]),
+    ("เซลล์", ["เซ", "ซล", "ลล", "ล์"]),
+    ("ATP ในเซล", ["atp", "ใน", "นเ", "เซ", "ซล"]),
+    ("ก", ["ก"]),
+    ("?!", []),
+])
+def test_tokenize_falls_back_to_thai_bigrams(text, tokens):
+    assert tokenize(text) == tokens
+
+
+def test_bm25_ranks_more_frequent_and_rarer_terms_higher():
+    index = LexicalIndex()
+    index.upsert(1, "cell cell cell membrane", row(1, ""))
+    index.upsert(2, "cell wall", row(2, ""))
+    index.upsert(3, "photosynthesis", row(3, ""))
+    assert [doc_id for _, doc_id, _ in index.search("cell", 3)] == [1, 2]
+    # "wall" appears in one document only, it outweighs the common "cell"
+    assert [doc_id for _, doc_id, _ in index.search("cell wall", 3)] == [2, 1]
+    assert index.search("xylem", 3) == []
+
+
+def test_filters_select_partitions():
+    index = LexicalIndex()
+    index.upsert(1, "mitochondria", row(1, "", room=301))
+    index.upsert(2, "mitochondria", row(2, "", room=302))
+    index.upsert(3, "mitochondria", row(3, "", year=4, room=401, subject="chem"))
+    assert {doc_id for _, doc_id, _ in index.search("mitochondria", 5, room=302)} == {2}
+    assert {doc_id for _, doc_id, _ in index.search("mitochondria", 5, year=3)} == {1, 2}
+    assert {doc_id for _, doc_id, _ in index.search("mitochondria", 5, subject="chem")} == {3}
+
+
+def test_upsert_moves_documents_between_partitions_and_remove_forgets_them():
+    index = LexicalIndex()
+    index.upsert(1, "enzyme", row(1, "", room=301))
+    index.upsert(1, "enzyme", row(1, "", room=302))
+    assert index.search("enzyme", 5, room=301) == []
+    assert len(index.search("enzyme", 5, room=302)) == 1
+    assert index.remove(1) and len(index) == 0
+    assert index.search("enzyme", 5) == []
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[2][1] == pytest.approx(1 / 62)
+
+
+def test_keyword_only_hit_reaches_the_prompt(monkeypatch):
+    vectors = VectorIndex()
+    lexical = LexicalIndex()
+    docs = [row(1, "ต้นไม้สังเคราะห์ด้วยแสง"), row(2, "ไมโทคอนเดรียสร้างพลังงานให้เซลล์"),
+            row(3, "การหายใจของสัตว์")]
+    for doc, vector in zip(docs, ([1.0, 0.0], [0.1, 1.0], [0.9, 0.3])):
+        vectors.upsert(("document", doc["id"]), vector, doc)
+        lexical.upsert(("document", doc["id"]), doc["content"], doc)
+    vectors.loaded = True
+    monkeypatch.setattr(func, "index", vectors)
+    monkeypatch.setattr(func, "lexical_index", lexical)
+    monkeypatch.setattr(func, "RETRIEVAL_MODE", "local")
+    monkeypatch.setattr(func, "_document_passages", {})
+
+    query = np.array([1.0, 0.0], dtype=np.float32)
+    retrieved = asyncio.run(func.search_documents(query, 3, None, None, None, "ไมโทคอนเดรีย"))
+    # the exact keyword match is ranked second and its cosine is far below the best one
+    assert retrieved[1][1] == docs[1]["content"] and retrieved[1][9]
+    assert retrieved[1][0] < 0.5 * retrieved[0][0]
+    assert "ไมโทคอนเดรีย" in func.build_context(retrieved, "gemini")
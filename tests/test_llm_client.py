@@ -0,0 +1,154 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from llm_client import CircuitBreaker, FailoverClient, GeminiClient, LLMError
+
+
+def gemini_reply(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+
+def gemini(statuses, max_retries=3):
+    """GeminiClient on a mock transport answering with statuses in turn, then 200."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        status = statuses[len(requests) - 1] if len(requests) <= len(statuses) else 200
+        if status == "connect error":
+            raise httpx.ConnectError("refused", request=request)
+        if status != 200:
+            return httpx.Response(status, text="upstream says no")
+        if request.url.params.get("alt") == "sse":
+            body = "".join(f"data: {json.dumps(gemini_reply(text))}\n\n" for text in ("สวัส", "ดี"))
+            return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json=gemini_reply("สวัสดี"))
+
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    client = GeminiClient(http_client, "key", base_url="http://gemini.test/v1beta", max_retries=max_retries,
+                          backoff=0, breaker=CircuitBreaker(failure_threshold=2))
+    return client, requests
+
+
+async def collect(stream):
+    return [item async for item in stream]
+
+
+@pytest.mark.parametrize("statuses", [[429], [500, 503], [502, 504, "connect error"]])
+def test_retryable_failures_are_retried(statuses):
+    client, requests = gemini(statuses)
+    assert asyncio.run(client.generate("hi")) == "สวัสดี"
+    assert len(requests) == len(statuses) + 1
+    assert requests[0].headers["x-goog-api-key"] == "key"
+    assert requests[0].url.path == "/v1beta/models/gemini-2.0-flash:generateContent"
+
+
+@pytest.mark.parametrize("status", [400, 403, 404])
+def test_client_errors_are_not_retried(status):
+    client, requests = gemini([status])
+    with pytest.raises(LLMError, match=f"HTTP {status}"):
+        asyncio.run(client.generate("hi"))
+    assert len(requests) == 1
+    # the backend answered, it doesn't count towards the breaker
+    assert client.breaker.failures == 0
+
+
+def test_retries_stop_at_max_retries_and_count_for_the_breaker():
+    client, requests = gemini([503] * 10, max_retries=2)
+    with pytest.raises(LLMError, match="HTTP 503"):
+        asyncio.run(client.generate("hi"))
+    assert len(requests) == 3
+    assert client.breaker.failures == 1
+
+
+def test_retry_after_sets_the_delay_up_to_max_backoff():
+    client, _ = gemini([])
+    client.backoff, client.max_backoff = 1.0, 8.0
+    assert client._delay(0, httpx.Response(429, headers={"Retry-After": "3"})) == 3.0
+    assert client._delay(0, httpx.Response(429, headers={"Retry-After": "120"})) == 8.0
+    for attempt in range(6):
+        assert 0 <= client._delay(attempt, httpx.Response(503)) <= min(8.0, 2 ** attempt)
+
+
+def test_stream_yields_the_sse_chunks():
+    client, requests = gemini([503])
+    assert asyncio.run(collect(client.stream("hi"))) == ["สวัส", "ดี"]
+    assert requests[-1].url.path.endswith(":streamGenerateContent")
+
+
+class FakeBackend:
+    """generate fails when fail_at is set, stream fails before chunk number fail_at."""
+
+    def __init__(self, name, chunks=("answer",), fail_at=None):
+        self.name = name
+        self.chunks = chunks
+        self.fail_at = fail_at
+        self.prompts = []
+
+    async def generate(self, prompt, json_output=False, group=None):
+        self.prompts.append(prompt)
+        if self.fail_at is not None:
+            raise LLMError(f"{self.name} is down")
+        return "".join(self.chunks)
+
+    async def stream(self, prompt, group=None):
+        self.prompts.append(prompt)
+        for i, chunk in enumerate(self.chunks):
+            if i == self.fail_at:
+                raise LLMError(f"{self.name} stream broke")
+            yield chunk
+
+
+def test_generate_falls_back_with_the_fallback_prompt():
+    primary = FakeBackend("gemini", fail_at=0)
+    fallback = FakeBackend("ollama", chunks=("local",))
+    client = FailoverClient(primary, fallback)
+    assert asyncio.run(client.generate("big prompt", fallback_prompt=lambda: "small prompt")) == ("local", "ollama")
+    assert fallback.prompts == ["small prompt"]
+
+
+def test_generate_without_fallback_raises():
+    client = FailoverClient(FakeBackend("gemini", fail_at=0))
+    with pytest.raises(LLMError):
+        asyncio.run(client.generate("hi"))
+
+
+def test_stream_falls_back_before_the_first_chunk():
+    fallback = FakeBackend("ollama", chunks=("a", "b"))
+    client = FailoverClient(FakeBackend("gemini", fail_at=0), fallback)
+    assert asyncio.run(collect(client.stream("hi", fallback_prompt="small"))) == [("ollama", "a"), ("ollama", "b")]
+    assert fallback.prompts == ["small"]
+
+
+def test_stream_does_not_fall_back_after_a_chunk_was_sent():
+    fallback = FakeBackend("ollama")
+    client = FailoverClient(FakeBackend("gemini", chunks=("a", "b"), fail_at=1), fallback)
+    received = []
+
+    async def consume():
+        async for item in client.stream("hi"):
+            received.append(item)
+
+    with pytest.raises(LLMError):
+        asyncio.run(consume())
+    assert received == [("gemini", "a")]
+    assert fallback.prompts == []
+
+
+def test_fallback_prompt_can_be_a_coroutine_and_is_only_built_on_failover():
+    built = []
+
+    async def small_prompt():
+        built.append(1)
+        return "small prompt"
+
+    fallback = FakeBackend("ollama")
+    assert asyncio.run(FailoverClient(FakeBackend("gemini"), fallback).generate("hi", fallback_prompt=small_prompt)) \
+        == ("answer", "gemini")
+    assert built == []
+    assert asyncio.run(collect(FailoverClient(FakeBackend("gemini", fail_at=0), fallback).stream(
+        "hi", fallback_prompt=small_prompt))) == [("ollama", "answer")]
+    assert fallback.prompts == ["small prompt"]
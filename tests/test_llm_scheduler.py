@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from llm_scheduler import LLMScheduler, SchedulerBusy
+
+
+def test_identical_requests_share_one_generation():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=1)
+        calls = []
+
+        async def generate():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(scheduler.run("key", "room", generate) for _ in range(3)))
+        return results, calls, scheduler
+
+    results, calls, scheduler = asyncio.run(main())
+    assert results == ["answer"] * 3
+    assert len(calls) == 1
+    assert scheduler.coalesced == 2
+    assert scheduler.active == 0
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=1)
+        release = asyncio.Event()
+
+        async def generate():
+            await release.wait()
+            return "answer"
+
+        leader = asyncio.create_task(scheduler.run("key", "room", generate))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(scheduler.run("key", "room", generate))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower, scheduler
+
+    result, scheduler = asyncio.run(main())
+    assert result == "answer"
+    assert scheduler.active == 0
+
+
+def test_generation_is_cancelled_when_every_caller_is_gone():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=1)
+        cancelled = asyncio.Event()
+
+        async def generate():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(scheduler.run("key", "room", generate))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler.active == 0
+    assert not scheduler._inflight
+
+
+def test_errors_reach_every_caller():
+    async def main():
+        scheduler = LLMScheduler()
+
+        async def generate():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("model crashed")
+
+        return await asyncio.gather(*(scheduler.run("key", "room", generate) for _ in range(2)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+
+
+def test_full_queue_fails_fast():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+        release = asyncio.Event()
+
+        async def generate():
+            await release.wait()
+            return "answer"
+
+        running = asyncio.create_task(scheduler.run("a", "room", generate))
+        queued = asyncio.create_task(scheduler.run("b", "room", generate))
+        await asyncio.sleep(0.01)
+        with pytest.raises(SchedulerBusy):
+            await scheduler.run("c", "room", generate)
+        release.set()
+        await asyncio.gather(running, queued)
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler.rejected == 1
+    assert scheduler.active == 0
+
+
+def test_slots_rotate_across_groups():
+    async def main():
+        scheduler = LLMScheduler(max_concurrency=1)
+        order = []
+        release = asyncio.Event()
+
+        async def blocker():
+            await release.wait()
+
+        def generation(name):
+            async def generate():
+                order.append(name)
+            return generate
+
+        first = asyncio.create_task(scheduler.run("block", "a", blocker))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(scheduler.run(name, group, generation(name)))
+                   for name, group in [("a1", "a"), ("a2", "a"), ("b1", "b")]]
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(first, *waiting)
+        return order
+
+    assert asyncio.run(main()) == ["a1", "b1", "a2"]
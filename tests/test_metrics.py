@@ -0,0 +1,66 @@
+import json
+import logging
+
+from fastapi.testclient import TestClient
+
+import metrics
+import toth_api
+
+
+def test_counter_renders_labels_escaped():
+    counter = metrics.Counter("t_total", "Test counter", ("route",))
+    counter.inc(route='/say "hi"')
+    counter.inc(2, route='/say "hi"')
+    assert counter.render() == ["# HELP t_total Test counter", "# TYPE t_total counter",
+                                't_total{route="/say \\"hi\\""} 3']
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("t_seconds", "Test histogram", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 20.0):
+        histogram.observe(value)
+    assert histogram.render()[2:] == [
+        't_seconds_bucket{le="0.1"} 2',
+        't_seconds_bucket{le="1.0"} 3',
+        't_seconds_bucket{le="+Inf"} 4',
+        "t_seconds_sum 20.65",
+        "t_seconds_count 4",
+    ]
+
+
+def test_failing_callback_keeps_the_rest_of_the_scrape():
+    registry = metrics.Registry()
+    registry.callback("t_broken", "Broken gauge", "gauge", lambda: 1 / 0)
+    registry.callback("t_rows", "Rows", "gauge", lambda: {("a",): 2}, ("kind",))
+    rendered = registry.render()
+    assert "# TYPE t_broken gauge" in rendered
+    assert 't_rows{kind="a"} 2' in rendered
+
+
+def test_log_lines_carry_the_request_id():
+    records = []
+    handler = logging.Handler()
+    handler.emit = lambda record: records.append(metrics.JsonFormatter().format(record))
+    metrics.logger.addHandler(handler)
+    level = metrics.logger.level
+    metrics.logger.setLevel(logging.INFO)
+    try:
+        with metrics.request_context("GET", "/test", "req-1"):
+            metrics.log_event("llm_error", logging.ERROR, backend="gemini", error="HTTP 503")
+    finally:
+        metrics.logger.removeHandler(handler)
+        metrics.logger.setLevel(level)
+    error, access = (json.loads(line) for line in records)
+    assert (error["event"], error["level"], error["request_id"], error["backend"]) == ("llm_error", "error", "req-1", "gemini")
+    assert access["event"] == "request" and access["request_id"] == "req-1"
+
+
+def test_metrics_endpoint_counts_requests():
+    client = TestClient(toth_api.app)
+    response = client.get("/metrics", headers={"X-Request-ID": "abc"})
+    assert response.headers["x-request-id"] == "abc"
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE toth_stage_seconds histogram" in response.text
+    second = client.get("/metrics").text
+    assert 'toth_http_requests_total{method="GET",route="/metrics",status="200"}' in second
+    assert 'toth_http_request_seconds_count{method="GET",route="/metrics"}' in second
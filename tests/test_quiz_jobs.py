@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+import pytest
+
+from quiz_jobs import QuizJobManager, RateLimiter, repair_quiz_json, validate_quiz
+
+
+def question(i, choices=None, correct="a"):
+    return {"question": f"ข้อ {i}", "choices": choices or {k: f"{k}{i}" for k in "abcd"}, "correct": correct}
+
+
+QUIZ = [question(i) for i in range(1, 6)]
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps(QUIZ, ensure_ascii=False),
+    "```json\n" + json.dumps(QUIZ, ensure_ascii=False) + "\n```",
+    "นี่คือควิซ:\n" + json.dumps(QUIZ, ensure_ascii=False) + "\nขอให้โชคดี",
+    json.dumps(QUIZ, ensure_ascii=False, indent=2).replace('"d": "d1"', '"d": "d1",').replace("}\n]", "},\n]"),
+    json.dumps({"questions": QUIZ}, ensure_ascii=False),
+])
+def test_repair_recovers_the_quiz(text):
+    assert repair_quiz_json(text) == QUIZ
+
+
+def test_repair_normalizes_field_names_and_answers():
+    raw = [{"Question": "ข้อ 1", "options": ["หนึ่ง", "สอง", "สาม", "สี่"], "answer": "สาม"},
+           {"question": "ข้อ 2", "choices": {"A)": "x", "B)": "y", "C)": "z", "D)": "w"}, "correct": "B."}]
+    assert repair_quiz_json(json.dumps(raw, ensure_ascii=False)) == [
+        {"question": "ข้อ 1", "choices": {"a": "หนึ่ง", "b": "สอง", "c": "สาม", "d": "สี่"}, "correct": "c"},
+        {"question": "ข้อ 2", "choices": {"a": "x", "b": "y", "c": "z", "d": "w"}, "correct": "b"},
+    ]
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps(QUIZ)[:-40],  # truncated output
+    "ขออภัย ไม่สามารถสร้างควิซได้",
+    '"just a string"',
+])
+def test_repair_rejects_unusable_output(text):
+    with pytest.raises(ValueError):
+        repair_quiz_json(text)
+
+
+@pytest.mark.parametrize("quiz, problem", [
+    (QUIZ[:4], "expected 5 questions, got 4"),
+    (QUIZ[:4] + [question(5, {"a": "1", "b": "2", "c": "3"})], "question 5: choices must be a, b, c, d"),
+    (QUIZ[:4] + [question(5, {"a": "1", "b": "2", "c": "3", "d": "4", "e": "5"})],
+     "question 5: choices must be a, b, c, d"),
+    (QUIZ[:4] + [question(5, {"a": "1", "b": "1", "c": "3", "d": "4"})],
+     "question 5: choices must be 4 different non-empty answers"),
+    (QUIZ[:4] + [question(5, correct="e")], "question 5: correct must be one of a, b, c, d"),
+    (QUIZ[:4] + [{"question": "", "choices": {}, "correct": "a"}], "question 5: missing question text"),
+])
+def test_validate_reports_schema_problems(quiz, problem):
+    assert problem in validate_quiz(quiz)
+
+
+def test_validate_accepts_a_good_quiz():
+    assert validate_quiz(QUIZ) == []
+
+
+def test_every_llm_attempt_waits_for_the_rate_limiter():
+    calls = []
+
+    async def generate(k, room, year, subject, before_call):
+        for _ in range(2):  # a first invalid answer and a retry
+            await before_call()
+            calls.append(room)
+        return {"error": False, "data": QUIZ}
+
+    async def store(scope, questions):
+        return 1
+
+    async def main():
+        manager = QuizJobManager(generate, store)
+        waits = []
+        manager.rate_limiter.wait = lambda: waits.append(1) or asyncio.sleep(0)
+        job = await manager.submit([{"room_id": 301}, {"room_id": 302}])
+        await asyncio.gather(*manager._tasks)
+        return job, waits
+
+    job, waits = asyncio.run(main())
+    assert job["status"] == "done"
+    assert len(waits) == len(calls) == 4
+
+
+def test_rate_limiter_spaces_calls():
+    async def main():
+        limiter = RateLimiter(rate_per_minute=60 * 50)  # 20 ms apart
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(4):
+            await limiter.wait()
+        return loop.time() - start
+
+    assert asyncio.run(main()) >= 0.055
+
+
+def test_job_status_is_readable_from_another_worker():
+    saved = {}
+
+    async def save(job):
+        saved[job["id"]] = job
+
+    async def load(job_id):
+        return saved.get(job_id)
+
+    async def generate(k, room, year, subject, before_call):
+        await before_call()
+        if room == 302:
+            return {"error": True, "message": "ไม่พบข้อมูลสำหรับการสร้างควิซ"}
+        return {"error": False, "data": QUIZ}
+
+    async def store(scope, questions):
+        return 7
+
+    async def main():
+        worker = QuizJobManager(generate, store, rate_per_minute=0, save=save, load=load)
+        other = QuizJobManager(generate, store, save=save, load=load)
+        job = await worker.submit([{"room_id": 301}, {"room_id": 302}])
+        assert (await other.get(job["id"]))["status"] == "queued"
+        await asyncio.gather(*worker._tasks)
+        return await other.get(job["id"]), await other.get("missing")
+
+    job, missing = asyncio.run(main())
+    assert missing is None
+    assert job["status"] == "partial" and job["finished_at"]
+    assert [(s["status"], s["quiz_id"]) for s in job["scopes"]] == [("done", 7), ("failed", None)]
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import response_cache
+from response_cache import create_response_cache
+
+QUESTION = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+SIMILAR = np.array([0.99, 0.05, 0.0], dtype=np.float32)
+OTHER = np.array([0.0, 1.0, 0.0], dtype=np.float32)
+SCOPE = ("gemini", 3, 301, "math")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    return create_response_cache(request.param, path=str(tmp_path / "cache.sqlite3"), threshold=0.95)
+
+
+def test_hits_similar_questions_in_the_same_scope(cache):
+    cache.put(SCOPE, QUESTION, "answer")
+    assert cache.get(SCOPE, SIMILAR) == "answer"
+    assert cache.get(SCOPE, OTHER) is None
+    assert cache.get(("ollama", 3, 301, "math"), QUESTION) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_invalidate_drops_scopes_that_include_the_document(cache):
+    cache.put(("gemini", None, None, None), QUESTION, "any class")
+    cache.put(SCOPE, QUESTION, "room 301")
+    cache.put(("gemini", 3, 302, "math"), QUESTION, "room 302")
+    assert cache.invalidate(3, 301, "math") == 2
+    assert cache.get(("gemini", 3, 302, "math"), QUESTION) == "room 302"
+    assert cache.get(SCOPE, QUESTION) is None
+
+
+def test_sqlite_opens_the_file_on_first_use(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = create_response_cache("sqlite", path=str(path))
+    assert not path.exists()
+    cache.put(SCOPE, QUESTION, "answer")
+    assert path.exists()
+
+
+def test_sqlite_reopens_after_fork(tmp_path, monkeypatch):
+    cache = create_response_cache("sqlite", path=str(tmp_path / "cache.sqlite3"))
+    cache.put(SCOPE, QUESTION, "answer")
+    parent_connection = cache.backend._db
+    monkeypatch.setattr(response_cache.os, "getpid", lambda: -1)
+    assert cache.get(SCOPE, QUESTION) == "answer"
+    assert cache.backend._db is not parent_connection
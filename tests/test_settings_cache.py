@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from settings_cache import SettingsCache
+
+
+class Source:
+    """fetch() returns 1, 2, ... and raises once fail is set; calls can be held with gate."""
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+        self.gate = None
+        self.done = threading.Event()
+
+    def fetch(self):
+        try:
+            if self.gate is not None:
+                self.gate.wait(5)
+            if self.fail:
+                raise RuntimeError("database is down")
+            self.calls += 1
+            return self.calls
+        finally:
+            self.done.set()
+
+
+def age(cache, seconds):
+    cache._loaded_at -= seconds
+
+
+def wait_for_refresh(cache, source):
+    assert source.done.wait(5)
+    deadline = time.monotonic() + 5
+    while cache._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_fresh_value_is_served_without_fetching():
+    source = Source()
+    cache = SettingsCache(source.fetch, ttl=5, max_stale=60)
+    assert cache.get() == 1
+    assert cache.get() == 1
+    assert source.calls == 1
+
+
+def test_stale_value_is_served_while_one_background_refresh_runs():
+    source = Source()
+    cache = SettingsCache(source.fetch, ttl=5, max_stale=60)
+    cache.get()
+    age(cache, 10)
+    source.gate, source.done = threading.Event(), threading.Event()
+
+    assert cache.get() == 1  # served at once, the refresh is held by the gate
+    assert cache.get() == 1  # no second refresh while one is running
+    source.gate.set()
+    wait_for_refresh(cache, source)
+    assert source.calls == 2
+    assert cache.get() == 2
+
+
+def test_refresh_failure_keeps_the_stale_value():
+    source = Source()
+    cache = SettingsCache(source.fetch, ttl=5, max_stale=60)
+    cache.get()
+    age(cache, 10)
+    source.fail, source.done = True, threading.Event()
+
+    assert cache.get() == 1
+    wait_for_refresh(cache, source)
+    assert cache.get() == 1
+
+    # past max_stale the fetch runs inline and its error reaches the caller
+    age(cache, 60)
+    with pytest.raises(RuntimeError):
+        cache.get()
+    source.fail = False
+    assert cache.get() == 2
+
+
+def test_invalidate_fetches_on_the_next_get():
+    source = Source()
+    cache = SettingsCache(source.fetch)
+    cache.get()
+    cache.invalidate()
+    assert cache.get() == 2
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import func
+import toth_api
+from llm_client import FailoverClient, LLMError
+
+client = TestClient(toth_api.app)
+
+DOCS = [(0.9, "การสังเคราะห์ด้วยแสงเกิดที่คลอโรพลาสต์", "2025-07-01", "10:00:00", "ครูสมชาย", "bio", 3, 301, None, False)]
+
+
+class Backend:
+    """Streams chunks, or raises LLMError before the first one when down is set."""
+
+    def __init__(self, name, chunks=("คลอ", "โรพลาสต์"), down=False):
+        self.name = name
+        self.chunks = chunks
+        self.down = down
+        self.prompts = []
+
+    async def stream(self, prompt, group=None):
+        self.prompts.append(prompt)
+        if self.down:
+            raise LLMError(f"{self.name} is down")
+        for chunk in self.chunks:
+            yield chunk
+
+
+def parse_sse(frames):
+    """Splits SSE text into (event, data) pairs, checking every frame is complete."""
+    text = "".join(frames)
+    assert text.endswith("\n\n")
+    events = []
+    for frame in text[:-2].split("\n\n"):
+        event, data = frame.split("\n")
+        assert event.startswith("event: ") and data.startswith("data: ")
+        events.append((event[7:], json.loads(data[6:])))
+    return events
+
+
+async def collect(stream):
+    return [frame async for frame in stream]
+
+
+@pytest.fixture
+def stream_setup(monkeypatch):
+    """Retrieval stubbed out, returns the answers handed to cache_answer."""
+    async def check_and_embed(query):
+        return True, np.ones(4, dtype=np.float32)
+
+    async def search_documents(query_embedding, k, roomId, yearId, subjectId, query=None):
+        return DOCS
+
+    cached = []
+
+    async def cache_answer(llm, query_embedding, roomId, yearId, subjectId, content):
+        cached.append((llm, content))
+
+    monkeypatch.setattr(func, "check_and_embed", check_and_embed)
+    monkeypatch.setattr(func, "search_documents", search_documents)
+    monkeypatch.setattr(func, "cache_answer", cache_answer)
+    monkeypatch.setattr(func, "response_cache", None)
+    return cached
+
+
+def stream_events(monkeypatch, primary, fallback=None):
+    monkeypatch.setattr(func, "gemini_failover", FailoverClient(primary, fallback))
+    return parse_sse(asyncio.run(collect(func.stream_gemini("คลอโรพลาสต์คืออะไร", 5, 301, 3, "bio"))))
+
+
+def test_stream_sends_context_tokens_then_done(monkeypatch, stream_setup):
+    events = stream_events(monkeypatch, Backend("gemini"), Backend("ollama"))
+    assert [event for event, _ in events] == ["context", "token", "token", "done"]
+    assert events[0][1] == [{"similarity": 0.9, "created_at": "2025-07-01", "time_of_record": "10:00:00",
+                             "teacher_name": "ครูสมชาย", "teacher_subject": "bio", "student_year": 3,
+                             "student_room": 301}]
+    assert [data["content"] for event, data in events if event == "token"] == ["คลอ", "โรพลาสต์"]
+    assert events[-1][1] == {}
+    assert stream_setup == [("gemini", "คลอโรพลาสต์")]
+
+
+def test_fallback_answer_is_streamed_but_not_cached(monkeypatch, stream_setup):
+    fallback = Backend("ollama", chunks=("ตอบจากเครื่อง",))
+    events = stream_events(monkeypatch, Backend("gemini", down=True), fallback)
+    assert events[1:] == [("token", {"content": "ตอบจากเครื่อง"}), ("done", {})]
+    assert len(fallback.prompts) == 1
+    assert stream_setup == []
+
+
+def test_failed_backends_send_an_error_event_then_done(monkeypatch, stream_setup):
+    events = stream_events(monkeypatch, Backend("gemini", down=True), Backend("ollama", down=True))
+    assert events[1:] == [("error", {"error": "gemini", "details": func.GEMINI_ERROR_MESSAGE}), ("done", {})]
+    assert stream_setup == []
+
+
+def test_nothing_found_closes_the_stream_without_calling_the_model(monkeypatch, stream_setup):
+    async def search_documents(query_embedding, k, roomId, yearId, subjectId, query=None):
+        return []
+
+    monkeypatch.setattr(func, "search_documents", search_documents)
+    primary = Backend("gemini")
+    events = stream_events(monkeypatch, primary)
+    assert events == [("token", {"content": "ไม่พบข้อมูลที่เกี่ยวข้อง"}), ("done", {})]
+    assert primary.prompts == []
+
+
+def test_endpoint_streams_server_sent_events(monkeypatch, stream_setup):
+    monkeypatch.setattr(func, "gemini_failover", FailoverClient(Backend("gemini")))
+    response = client.post("/fetch-gemini", json={"prompt": "คลอโรพลาสต์คืออะไร", "stream": True})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    assert [event for event, _ in parse_sse([response.text])] == ["context", "token", "token", "done"]
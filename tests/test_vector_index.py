@@ -0,0 +1,73 @@
+import numpy as np
+
+from vector_index import VectorIndex, normalize
+
+
+def row(doc_id, year=3, room=301, subject="bio"):
+    return {"id": doc_id, "content": f"doc {doc_id}", "student_year": year,
+            "student_room": room, "teacher_subject": subject}
+
+
+def test_normalize_keeps_zero_vectors():
+    vectors = normalize(np.array([[3.0, 4.0], [0.0, 0.0]]))
+    assert np.allclose(vectors, [[0.6, 0.8], [0.0, 0.0]])
+
+
+def test_search_ranks_by_cosine_similarity():
+    index = VectorIndex()
+    index.upsert(1, [1.0, 0.0], row(1))
+    index.upsert(2, [0.0, 1.0], row(2))
+    index.upsert(3, [1.0, 1.0], row(3))
+    hits = index.search([2.0, 0.1], 2)
+    assert [r["id"] for _, r in hits] == [1, 3]
+    assert hits[0][0] > hits[1][0]
+
+
+def test_filters_select_partitions():
+    index = VectorIndex()
+    index.upsert(1, [1.0, 0.0], row(1, room=301))
+    index.upsert(2, [1.0, 0.0], row(2, room=302))
+    index.upsert(3, [1.0, 0.0], row(3, year=4, room=401, subject="phy"))
+    assert [r["id"] for _, r in index.search([1.0, 0.0], 5, year=3, room=302, subject="bio")] == [2]
+    assert sorted(r["id"] for _, r in index.search([1.0, 0.0], 5, year=3)) == [1, 2]
+    assert len(index.search([1.0, 0.0], 5)) == 3
+    assert index.search([1.0, 0.0], 5, year=9) == []
+    assert index.partition_count == 3
+
+
+def test_upsert_replaces_and_remove_keeps_matrix_contiguous():
+    index = VectorIndex()
+    for doc_id in range(1, 40):
+        index.upsert(doc_id, [1.0, doc_id / 100], row(doc_id))
+    index.upsert(5, [0.0, 1.0], row(5))
+    assert len(index) == 39
+    assert index.search([0.0, 1.0], 1)[0][1]["id"] == 5
+
+    assert index.remove(1, row(1))
+    assert not index.remove(1, row(1))
+    assert len(index) == 38
+    ids = {r["id"] for _, r in index.search([1.0, 0.0], 100)}
+    assert ids == set(range(2, 40))
+    assert np.allclose(index.get(39, row(39)), normalize([1.0, 0.39]))
+
+
+def test_with_vectors_returns_normalized_copies():
+    index = VectorIndex()
+    index.upsert(1, [3.0, 4.0], row(1))
+    score, hit, vector = index.search([3.0, 4.0], 1, with_vectors=True)[0]
+    assert np.isclose(score, 1.0)
+    assert np.allclose(vector, [0.6, 0.8])
+    vector[0] = 9.0
+    assert np.allclose(index.get(1, row(1)), [0.6, 0.8])
+
+
+def test_upsert_with_the_same_vector_keeps_the_ann_graph():
+    index = VectorIndex()
+    index.upsert(1, [1.0, 0.0], row(1))
+    partition = index._partitions[VectorIndex.partition_key(row(1))]
+    graph = partition.ann = object()
+    index.upsert(1, [2.0, 0.0], dict(row(1), content="edited"))
+    assert partition.ann is graph
+    assert partition.rows[0]["content"] == "edited"
+    index.upsert(1, [0.0, 1.0], row(1))
+    assert partition.ann is None
@@ -1,8 +1,13 @@
+import asyncio
+import json
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, time
 from typing import Union
-from pydantic import BaseModel
-from typing import Dict, Any
+from pydantic import BaseModel, ValidationError
+from typing import Dict, Any, List
 # Ensure func.py is in the same directory or adjust the import path accordingly
-from func import gen_response, qeury_database, add_document , gen_gemini, check_database_status,school_data
+from func import gen_response, qeury_database, add_document , gen_gemini, check_database_status,school_data, start_index_sync, index_status, close_clients, warm_up, readiness, health_monitor, stream_response, stream_gemini, add_documents, gen_quizz_gemini, quiz_jobs, latest_quiz
 
 
 # run with
@@ -11,9 +16,39 @@ from func import gen_response, qeury_database, add_document , gen_gemini, check_
 #subject list
 # bio,phy,chem,math,eng,geo,his,eco,pol,soc,art,music,pe,comsci
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import metrics
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    metrics.init_tracing()
+    # load the embedding model and the index without holding up the port, see /ready
+    app.state.warm_up = asyncio.create_task(asyncio.to_thread(warm_up))
+    # keep the in-process vector index in step with inserts from other workers
+    start_index_sync()
+    # database and LLM checks for /ready and /health, first round right away
+    health_monitor.start()
+    yield
+    await health_monitor.stop()
+    await close_clients()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    # request id for the structured log, per-stage timings and request metrics
+    incoming_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    with metrics.request_context(request.method, "unmatched", incoming_id) as info:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        info["route"] = getattr(route, "path", "unmatched")
+        info["status"] = response.status_code
+        response.headers["X-Request-ID"] = incoming_id
+        return response
 
 
 class SetDataRequest(BaseModel):
@@ -22,6 +57,7 @@ class SetDataRequest(BaseModel):
     room_id: Union[int, None] = None  # Optional room_id field
     year_id: Union[int, None] = None  # Optional year_id field
     subject_id: Union[str, None] = None  # Optional subject_id field
+    stream: Union[bool, None] = False  # Stream tokens as server-sent events
     
 class SetDataGemini(BaseModel):
     prompt: Union[str, None] = None
@@ -29,45 +65,180 @@ class SetDataGemini(BaseModel):
     room_id: Union[int, None] = None  # Optional room_id field
     year_id: Union[int, None] = None  # Optional year_id field
     subject_id: Union[str, None] = None  # Optional subject_id field
+    stream: Union[bool, None] = False  # Stream tokens as server-sent events
     
 class AddDocumentRequest(BaseModel):
     content: Dict[str, Any] 
 
+class DocumentItem(BaseModel):
+    teacher_name: str
+    teacher_subject: str
+    time_summit: datetime
+    time_of_record: time
+    student_year: int
+    student_room: int
+    content: str
+
+
+class QuizScope(BaseModel):
+    year_id: Union[int, None] = None
+    room_id: Union[int, None] = None
+    subject_id: Union[str, None] = None
+
+class QuizJobRequest(BaseModel):
+    scopes: List[QuizScope]
+    k: Union[int, None] = 5  # lesson records per quiz
+
+
+class InvalidJSONLine:
+    """Stands in for an NDJSON line that isn't JSON, reported as that item's error."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def validate_documents(items):
+    """
+    Validates lesson records one by one. Returns (valid documents as dicts,
+    their positions in items, per-item errors) so one bad record doesn't
+    reject the whole batch.
+    """
+    valid, positions, errors = [], [], []
+    for i, item in enumerate(items):
+        if isinstance(item, InvalidJSONLine):
+            errors.append({"index": i, "status": "error", "error": f"invalid JSON: {item.error}"})
+            continue
+        try:
+            valid.append(DocumentItem.model_validate(item).model_dump())
+            positions.append(i)
+        except ValidationError as e:
+            errors.append({"index": i, "status": "error", "error": e.errors(include_url=False, include_context=False)})
+    return valid, positions, errors
+
+
+def parse_ndjson(text):
+    items = []
+    for line in text.splitlines():
+        if line.strip():
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                items.append(InvalidJSONLine(e))
+    return items
+
+
+async def ingest_documents(items, chunk_size=500):
+    """Validates then bulk inserts items, reporting results by their position in items."""
+    valid, positions, errors = validate_documents(items)
+    result = await add_documents(valid, chunk_size) if valid else {"inserted": 0, "failed": 0, "results": []}
+    if not isinstance(result, dict) or "results" not in result:
+        return result  # system check failed
+    for item in result["results"]:
+        item["index"] = positions[item["index"]]
+    results = sorted(result["results"] + errors, key=lambda r: r["index"])
+    return {"inserted": result["inserted"], "failed": result["failed"] + len(errors), "results": results}
+
+
+def sse_response(events):
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 
 @app.get("/")
 def read_root():
     return {"Hello user": "toth is running pls use /fetch-response or /add-document"}
 
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/live")
+def live():
+    # liveness: the process answers, no dependency is touched
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    # 503 until this worker can answer queries without a cold start
+    status = readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 @app.get("/health")
-def health_check():
-    return {"status" : check_database_status()}
+async def health_check():
+    return {"status" : await check_database_status(), "index": index_status()}
 
 @app.post("/fetch-response")
-def set_data(request: SetDataRequest):
+async def set_data(request: SetDataRequest):
+    if request.stream and request.prompt:
+        return sse_response(stream_response(request.prompt, request.k, request.room_id, request.year_id, request.subject_id))
     return {
-       #  "message": qeury_database(request.prompt, request.k, request.room_id, request.year_id, request.subject_id),
+       #  "message": await qeury_database(request.prompt, request.k, request.room_id, request.year_id, request.subject_id),
         "k": request.k,
-        "data": gen_response(request.prompt, request.k, request.room_id, request.year_id, request.subject_id) if request.prompt else "No prompt provided"
+        "data": await gen_response(request.prompt, request.k, request.room_id, request.year_id, request.subject_id) if request.prompt else "No prompt provided"
     }
     
 @app.post("/fetch-gemini")
-def set_data(request: SetDataGemini):
+async def set_data(request: SetDataGemini):
+    if request.stream and request.prompt:
+        return sse_response(stream_gemini(request.prompt, request.k, request.room_id, request.year_id, request.subject_id))
     return {
-       #  "message": qeury_database(request.prompt, request.k, request.room_id, request.year_id, request.subject_id),
+       #  "message": await qeury_database(request.prompt, request.k, request.room_id, request.year_id, request.subject_id),
         "k": request.k,
-        "data": gen_gemini(request.prompt, request.k, request.room_id, request.year_id, request.subject_id) if request.prompt else "No prompt provided"
+        "data": await gen_gemini(request.prompt, request.k, request.room_id, request.year_id, request.subject_id) if request.prompt else "No prompt provided"
     }
     
 @app.post("/add-document")
-def set_data(request: AddDocumentRequest):
+async def set_data(request: AddDocumentRequest):
     return {
         "message": request.content,
-        "content": add_document(request.content)
+        "content": await add_document(request.content)
     }
     
+@app.post("/add-documents")
+async def set_documents(request: Request, chunk_size: int = Query(500, ge=1)):
+    # Accepts a JSON list, {"documents": [...]} or an application/x-ndjson body
+    try:
+        body = (await request.body()).decode("utf-8")
+        if "ndjson" in request.headers.get("content-type", ""):
+            items = parse_ndjson(body)
+        else:
+            items = json.loads(body)
+            if isinstance(items, dict):
+                items = items.get("documents", [])
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        return JSONResponse({"error": True, "message": f"อ่านข้อมูลไม่ได้ ต้องเป็น JSON หรือ NDJSON: {e}"}, status_code=400)
+    if not isinstance(items, list):
+        return JSONResponse({"error": True, "message": "ต้องส่งเอกสารเป็นรายการ (JSON list หรือ {\"documents\": [...]})"},
+                            status_code=400)
+    return {
+        "count": len(items),
+        "content": await ingest_documents(items, chunk_size)
+    }
+
 @app.get("/school-data")
-def fschool_data():
+async def fschool_data():
     return {
         "message": "This is a school data endpoint",
-        "data" : school_data()
+        "data" : await asyncio.to_thread(school_data)
     }
+
+@app.post("/quiz-jobs")
+async def create_quiz_job(request: QuizJobRequest):
+    # Generates one quiz per scope in the background, poll /quiz-jobs/{id}
+    job = await quiz_jobs.submit([scope.model_dump() for scope in request.scopes], request.k)
+    return {"job_id": job["id"], "status": job["status"], "count": len(job["scopes"])}
+
+@app.get("/quiz-jobs/{job_id}")
+async def get_quiz_job(job_id: str):
+    job = await quiz_jobs.get(job_id)
+    if job is None:
+        return {"error": True, "message": "ไม่พบงานสร้างควิซนี้"}
+    return job
+
+@app.get("/quiz")
+async def get_quiz(year_id: Union[int, None] = None, room_id: Union[int, None] = None,
+                   subject_id: Union[str, None] = None, fresh: bool = False):
+    # Latest precomputed quiz for the class, fresh=true generates one right now
+    if fresh:
+        return await gen_quizz_gemini(5, room_id, year_id, subject_id)
+    return await latest_quiz(room_id, year_id, subject_id)
@@ -0,0 +1,179 @@
+import threading
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # optional ANN backend
+    hnswlib = None
+
+
+def normalize(vector):
+    """Returns a float32 copy of the vector(s) scaled to unit length."""
+    vector = np.asarray(vector, dtype=np.float32)
+    norms = np.linalg.norm(vector, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vector / norms
+
+
+def _top_k(scores, k):
+    """Positions of the k highest scores, best first."""
+    if k >= len(scores):
+        order = np.argsort(-scores)
+    else:
+        order = np.argpartition(-scores, k - 1)[:k]
+        order = order[np.argsort(-scores[order])]
+    return order
+
+
+class _Partition:
+    """Pre-normalized vectors of one (year, room, subject) scope in a contiguous matrix."""
+
+    def __init__(self, dimension):
+        self.matrix = np.zeros((16, dimension), dtype=np.float32)
+        self.size = 0
+        self.rows = []
+        self.ids = []
+        self.positions = {}
+        self.ann = None
+
+    def upsert(self, doc_id, vector, row):
+        position = self.positions.get(doc_id)
+        if position is not None:
+            self.rows[position] = row
+            if not np.array_equal(self.matrix[position], vector):
+                self.matrix[position] = vector
+                # hnswlib cannot update a vector in place, rebuild on next search
+                self.ann = None
+            return
+        if self.size == len(self.matrix):
+            grown = np.zeros((len(self.matrix) * 2, self.matrix.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.matrix[:self.size]
+            self.matrix = grown
+        self.matrix[self.size] = vector
+        self.rows.append(row)
+        self.ids.append(doc_id)
+        self.positions[doc_id] = self.size
+        if self.ann is not None:
+            if self.ann.get_max_elements() <= self.size:
+                self.ann.resize_index(self.ann.get_max_elements() * 2)
+            self.ann.add_items(vector.reshape(1, -1), [self.size])
+        self.size += 1
+
+    def remove(self, doc_id):
+        position = self.positions.pop(doc_id, None)
+        if position is None:
+            return False
+        last = self.size - 1
+        if position != last:
+            # move the last vector into the hole to keep the matrix contiguous
+            self.matrix[position] = self.matrix[last]
+            self.rows[position] = self.rows[last]
+            self.ids[position] = self.ids[last]
+            self.positions[self.ids[position]] = position
+        self.rows.pop()
+        self.ids.pop()
+        self.size -= 1
+        self.ann = None
+        return True
+
+    def search(self, query, k, ann_min_rows):
+        if self.size == 0:
+            return []
+        if hnswlib is not None and ann_min_rows and self.size >= ann_min_rows:
+            if self.ann is None:
+                self.ann = hnswlib.Index(space='ip', dim=self.matrix.shape[1])
+                self.ann.init_index(max_elements=self.size * 2, ef_construction=200, M=16)
+                self.ann.add_items(self.matrix[:self.size], np.arange(self.size))
+            self.ann.set_ef(max(k * 2, 50))
+            labels, distances = self.ann.knn_query(query.reshape(1, -1), k=min(k, self.size))
+            # inner product space returns 1 - ip as the distance
+            return [(float(1.0 - d), self.rows[i], self.matrix[i].copy()) for i, d in zip(labels[0], distances[0])]
+
+        scores = self.matrix[:self.size] @ query
+        return [(float(scores[i]), self.rows[i], self.matrix[i].copy()) for i in _top_k(scores, k)]
+
+
+class VectorIndex:
+    """
+    In-process copy of the document embeddings, partitioned by
+    (student_year, student_room, teacher_subject).
+
+    Search cost is one matrix-vector product per matching partition. When
+    ann_min_rows is set and hnswlib is installed, partitions at least that
+    large are searched through an HNSW graph instead.
+    """
+
+    def __init__(self, ann_min_rows=0):
+        self.ann_min_rows = ann_min_rows
+        self.loaded = False
+        self.rows_scanned = 0
+        self._partitions = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def partition_key(row):
+        return (row.get('student_year'), row.get('student_room'), row.get('teacher_subject'))
+
+    def __len__(self):
+        return sum(p.size for p in self._partitions.values())
+
+    @property
+    def partition_count(self):
+        return len(self._partitions)
+
+    def upsert(self, doc_id, vector, row):
+        """Adds or replaces one document. The vector is normalized on the way in."""
+        vector = normalize(vector).reshape(-1)
+        key = self.partition_key(row)
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = _Partition(len(vector))
+            partition.upsert(doc_id, vector, row)
+
+    def remove(self, doc_id, row):
+        """Removes one entry, row is only used to find its partition."""
+        with self._lock:
+            partition = self._partitions.get(self.partition_key(row))
+            return partition.remove(doc_id) if partition is not None else False
+
+    def get(self, doc_id, row):
+        """Normalized vector of one entry or None, row is only used to find its partition."""
+        with self._lock:
+            partition = self._partitions.get(self.partition_key(row))
+            position = partition.positions.get(doc_id) if partition is not None else None
+            return partition.matrix[position].copy() if position is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._partitions = {}
+            self.loaded = False
+
+    def search(self, query, k, year=None, room=None, subject=None, with_vectors=False):
+        """
+        Returns up to k (similarity, row) pairs, best first, restricted to the
+        partitions matching the filters. A None filter matches any value.
+        with_vectors=True returns (similarity, row, normalized vector) instead.
+        """
+        query = normalize(query).reshape(-1)
+        with self._lock:
+            if year is not None and room is not None and subject is not None:
+                partition = self._partitions.get((year, room, subject))
+                partitions = [partition] if partition is not None else []
+            else:
+                partitions = [
+                    partition for (p_year, p_room, p_subject), partition in self._partitions.items()
+                    if (year is None or p_year == year)
+                    and (room is None or p_room == room)
+                    and (subject is None or p_subject == subject)
+                ]
+            self.rows_scanned += sum(partition.size for partition in partitions)
+            hits = []
+            for partition in partitions:
+                hits.extend(partition.search(query, k, self.ann_min_rows))
+
+        hits.sort(key=lambda x: x[0], reverse=True)
+        if with_vectors:
+            return hits[:k]
+        return [(score, row) for score, row, _ in hits[:k]]